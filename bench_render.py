@@ -0,0 +1,110 @@
+"""
+Бенчмарк слоя ответов: python bench_render.py
+
+Сравнивает прежнюю сборку ответа (клавиатура создаётся заново, карточка -
+большой f-string) с render.py + keyboards.py на потоке проверок, где часть
+записей запрашивается чаще остальных. В обоих случаях собирается объект
+SendMessage, как это делает message.answer().
+"""
+
+import random
+import time
+import tracemalloc
+
+from aiogram.methods import SendMessage
+from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
+
+import render
+from config import THREAT_LEVELS
+from keyboards import get_admin_keyboard
+
+RECORDS = 2000
+REQUESTS = 50000
+
+
+def old_admin_keyboard():
+    keyboard = [
+        [KeyboardButton(text="🔍 Проверить")],
+        [KeyboardButton(text="➕ Добавить"), KeyboardButton(text="📋 Все записи")],
+        [KeyboardButton(text="📊 Статистика"), KeyboardButton(text="❓ Справка")]
+    ]
+    return ReplyKeyboardMarkup(keyboard=keyboard, resize_keyboard=True)
+
+
+def old_user_card(user_data, old_usernames=None, found_note=""):
+    user_id, username, level, reason, proof, date, reports_count, score = user_data
+    level_info = THREAT_LEVELS.get(level, THREAT_LEVELS[3])
+    history = ", ".join(f"@{alias}" for alias in old_usernames or []) or "нет"
+
+    return (
+        f"{level_info['emoji']} <b>{level_info['name']}</b>\n\n"
+        f"{found_note}"
+        f"👤 <b>ID:</b> <code>{user_id}</code>\n"
+        f"📛 <b>Юзернейм:</b> @{username or 'не указан'}\n"
+        f"🕓 <b>Прежние юзернеймы:</b> {history}\n"
+        f"📝 <b>Причина:</b> {reason or 'Не указана'}\n"
+        f"🔗 <b>Доказательства:</b> {proof or 'Не приложены'}\n"
+        f"📨 <b>Жалоб:</b> {reports_count or 0} (рейтинг угрозы: {score or 0})\n"
+        f"📅 <b>Дата внесения:</b> {date or 'Неизвестно'}\n\n"
+        f"<i>База данных проекта TRUSTON</i>"
+    )
+
+
+def old_reply(user_data, aliases):
+    return SendMessage(chat_id=1, text=old_user_card(user_data, aliases), parse_mode="HTML",
+                       reply_markup=old_admin_keyboard())
+
+
+def new_reply(user_data, aliases):
+    return SendMessage(chat_id=1, text=render.user_card(user_data, aliases), parse_mode="HTML",
+                       reply_markup=get_admin_keyboard())
+
+
+def make_workload():
+    rng = random.Random(1)
+    records = [
+        ((str(10 ** 9 + i), f"user{i}", rng.choice((1, 2, 3)), "Не вернул деньги после сделки " * 3,
+          "https://t.me/c/123/456", "2026-01-01 12:00:00", rng.randint(1, 5), rng.randint(0, 15)),
+         [f"old_user{i}"] if i % 3 == 0 else [])
+        for i in range(RECORDS)
+    ]
+    # Популярные записи запрашивают чаще (как при волне проверок одного мошенника)
+    weights = [1 / (rank + 1) for rank in range(RECORDS)]
+    return rng.choices(records, weights=weights, k=REQUESTS)
+
+
+def measure(name, reply, workload):
+    started = time.perf_counter()
+    for user_data, aliases in workload:
+        reply(user_data, aliases)
+    elapsed = time.perf_counter() - started
+
+    # Память под сами ответы: держим их в списке, чтобы ничего не освободилось
+    sample = workload[:5000]
+    tracemalloc.start()
+    replies = [reply(user_data, aliases) for user_data, aliases in sample]
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del replies
+
+    print(f"{name:<10} {elapsed / len(workload) * 1e6:8.2f} мкс/ответ   {allocated / len(sample):8.0f} байт/ответ")
+    return elapsed
+
+
+def main():
+    workload = make_workload()
+    # Прогрев: импорты pydantic-моделей, кэш шаблонов
+    for user_data, aliases in workload[:1000]:
+        old_reply(user_data, aliases)
+        new_reply(user_data, aliases)
+    render._user_card.cache_clear()
+
+    print(f"Записей: {RECORDS}, ответов: {REQUESTS}")
+    old = measure("прежний", old_reply, workload)
+    new = measure("render", new_reply, workload)
+    info = render._user_card.cache_info()
+    print(f"Ускорение: x{old / new:.2f}, попаданий в кэш карточек: {info.hits / (info.hits + info.misses):.0%}")
+
+
+if __name__ == "__main__":
+    main()
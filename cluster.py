@@ -0,0 +1,211 @@
+"""
+Режим нескольких процессов: координатор + воркеры
+
+Один Python-процесс упирается в одно ядро. В этом режиме:
+  * координатор - единственный, кто получает апдейты (polling) и пишет
+    в базу: апдейты админов он обрабатывает сам, а после каждого
+    изменения журнала публикует новый снапшот индексов поиска;
+  * воркеры получают остальные апдейты через очередь (один чат всегда
+    попадает в один и тот же воркер, поэтому диалоги FSM не рвутся),
+    отвечают на проверки по снапшоту через mmap и подхватывают новую
+    версию файла сами. Базу воркер открывает только для чтения (без
+    миграций и дозаполнений), а единственную свою запись - смену
+    юзернейма пользователя из базы - отправляет координатору очередью.
+
+Запуск: python main.py --workers 4
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import queue
+import signal
+import time
+
+from aiogram import BaseMiddleware
+
+from config import ADMIN_IDS, SNAPSHOT_PATH, SHUTDOWN_TIMEOUT
+from database import Database, db
+from logging_setup import setup_logging
+from utils import normalize_username
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerDistributor(BaseMiddleware):
+    """Внешний middleware координатора: отдаёт апдейт воркеру вместо обработки"""
+
+    def __init__(self, queues):
+        self.queues = queues
+
+    async def __call__(self, handler, event, data):
+        user = data.get('event_from_user')
+        chat = data.get('event_chat')
+        # Админы пишут в базу - их обрабатывает координатор
+        if user is not None and user.id in ADMIN_IDS:
+            return await handler(event, data)
+
+        key = chat.id if chat is not None else (user.id if user is not None else event.update_id)
+        raw = event.model_dump(mode='json', exclude_none=True)
+        try:
+            self.queues[key % len(self.queues)].put_nowait(raw)
+        except queue.Full:
+            logger.warning(f"⚠️ Очередь воркера переполнена, апдейт {event.update_id} обработан координатором")
+            return await handler(event, data)
+
+
+class ForwardingDatabase(Database):
+    """База воркера: чтение напрямую, запись - через координатора"""
+
+    def __init__(self, writes):
+        super().__init__(readonly=True)
+        self.writes = writes
+
+    def observe_username(self, user_id, username):
+        # Проверка на чтение здесь, чтобы в очередь шли только настоящие смены
+        if not username:
+            return False
+        row = self.conn.execute('SELECT username FROM scammers WHERE user_id = ?', (str(user_id),)).fetchone()
+        if not row or normalize_username(row[0]) == normalize_username(username):
+            return False
+        try:
+            self.writes.put_nowait(('observe_username', (str(user_id), username)))
+        except queue.Full:
+            logger.warning(f"⚠️ Очередь записей переполнена, смена юзернейма ID={user_id} пропущена")
+            return False
+        return True
+
+
+# Что воркер может попросить записать
+FORWARDED_WRITES = {'observe_username'}
+
+
+async def apply_writes(writes):
+    """Координатор: выполняет записи воркеров, пока не придёт None"""
+    loop = asyncio.get_running_loop()
+    while True:
+        item = await loop.run_in_executor(None, writes.get)
+        if item is None:
+            return
+        name, args = item
+        if name not in FORWARDED_WRITES:
+            logger.warning(f"⚠️ Неизвестная запись от воркера: {name}")
+            continue
+        try:
+            getattr(db, name)(*args)
+        except Exception as e:
+            logger.error(f"❌ Ошибка записи от воркера ({name}): {e}")
+
+
+async def run_coordinator(bot, dp, workers, shutdown=None, snapshot_ready=None):
+    """Запускает воркеры и polling координатора (публикацию снапшота ведёт main).
+
+    snapshot_ready - первый проход publish_snapshots: воркеры не проверяют
+    контрольную сумму сами и стартуют после него. Polling его не ждёт -
+    апдейты копятся в очередях воркеров"""
+    ctx = multiprocessing.get_context('spawn')
+    queues = [ctx.Queue(maxsize=10000) for _ in range(workers)]
+    writes = ctx.Queue(maxsize=10000)
+    processes = [ctx.Process(target=worker_main, args=(i, queues[i], writes), name=f"worker-{i}", daemon=True)
+                 for i in range(workers)]
+
+    async def start_workers():
+        if snapshot_ready is not None:
+            await snapshot_ready.wait()
+        for process in processes:
+            process.start()
+        logger.info(f"👷 Запущено воркеров: {workers}")
+
+    dp.update.outer_middleware(WorkerDistributor(queues))
+    writer = asyncio.create_task(apply_writes(writes))
+    starter = asyncio.create_task(start_workers())
+
+    async def stop_workers():
+        """Воркеры дорабатывают свои очереди до подтверждения offset координатором"""
+        starter.cancel()
+        for q in queues:
+            q.put(None)
+        # Срок общий с ожиданием апдейтов координатора: вместе меньше STOP_TIMEOUT супервизора
+        await asyncio.to_thread(_join, processes, time.monotonic() + shutdown.remaining())
+        # Воркеры остановлены - дописываем их последние записи
+        writes.put(None)
+        await writer
+        await asyncio.to_thread(db.checkpoint)
+
+    if shutdown is not None:
+        shutdown.add_cleanup(stop_workers)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        starter.cancel()
+        if any(process.is_alive() for process in processes):
+            for q in queues:
+                q.put(None)
+            _join(processes, time.monotonic() + SHUTDOWN_TIMEOUT)
+        writes.put(None)
+        await writer
+
+
+def _join(processes, deadline):
+    """Ждёт воркеры до общего срока (time.monotonic()); не успевшие останавливает"""
+    for process in processes:
+        # Не запущенный (остановка до готовности снапшота) ждать нечего
+        if process.pid is not None:
+            process.join(timeout=max(0.0, deadline - time.monotonic()))
+    for process in processes:
+        if process.is_alive():
+            logger.warning(f"⚠️ {process.name} не остановился в срок, завершаю")
+            process.terminate()
+
+
+def worker_main(index, updates, writes):
+    """Точка входа процесса-воркера"""
+    setup_logging(f"worker-{index}")
+    # До первого обращения к db: миграции и дозаполнения - только у координатора
+    db.configure(lambda: ForwardingDatabase(writes))
+    # Сигнал остановки получает вся группа процессов; воркер останавливается
+    # только по None из очереди, когда координатор уже не раздаёт апдейты
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    asyncio.run(_worker_loop(index, updates))
+
+
+async def _worker_loop(index, updates):
+    import lookup
+    from fuzzy import fuzzy_index
+    from join_checker import join_checker
+    from prefix_index import prefix_index
+    from main import create_bot, create_dispatcher
+
+    lookup.use_snapshot(SNAPSHOT_PATH)
+    warm = [asyncio.create_task(fuzzy_index.warm()), asyncio.create_task(prefix_index.warm())]
+    bot = create_bot()
+    dp = create_dispatcher(shared=True)
+    loop = asyncio.get_running_loop()
+    tasks = set()
+
+    async def handle(raw):
+        try:
+            await dp.feed_raw_update(bot, raw)
+        except Exception as e:
+            logger.exception(f"❌ Ошибка обработки апдейта {raw.get('update_id')}: {e}")
+
+    logger.info(f"👷 Воркер {index} готов")
+    while True:
+        raw = await loop.run_in_executor(None, updates.get)
+        if raw is None:
+            break
+        task = asyncio.create_task(handle(raw))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    if tasks:
+        _, pending = await asyncio.wait(tasks, timeout=SHUTDOWN_TIMEOUT)
+        if pending:
+            logger.warning(f"⚠️ Воркер {index}: не завершились апдейты: {len(pending)}")
+    for task in warm:
+        task.cancel()
+    await join_checker.close()
+    await dp.fsm.storage.close()
+    await bot.session.close()
+    logger.info(f"👷 Воркер {index} остановлен")
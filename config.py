@@ -5,4 +5,102 @@ ADMIN_ID = 599952947
 ADMIN_IDS = [ADMIN_ID]
 
 # ID твоей Google таблицы
-GOOGLE_SHEET_ID = "1V8wMiD5N7_uEOFgow28-LDLtm64y0IElPWCxec8sa_M"  # ЗАМЕНИ ЭТО
\ No newline at end of file
+GOOGLE_SHEET_ID = "1V8wMiD5N7_uEOFgow28-LDLtm64y0IElPWCxec8sa_M"  # ЗАМЕНИ ЭТО
+PROJECT_NAME = "TRUSTON"
+
+# База бота (update_db.py и db_inspect.py по умолчанию работают с ней же)
+DB_PATH = "truston_scam.db"
+
+# Уровни угрозы; weight - вклад одной жалобы этого уровня в рейтинг угрозы
+THREAT_LEVELS = {
+    1: {
+        'emoji': '✅',
+        'name': 'Проверенный пользователь',
+        'description': 'Нареканий нет. Можно проводить сделки.',
+        'weight': 0,
+    },
+    2: {
+        'emoji': '⚠️',
+        'name': 'Требует осторожности',
+        'description': 'Есть жалобы. Используйте гаранта.',
+        'weight': 1,
+    },
+    3: {
+        'emoji': '🚨',
+        'name': 'Мошенник',
+        'description': 'Подтвержденный обман. Сделки запрещены!',
+        'weight': 3,
+    },
+}
+
+# Inline-режим (@bot запрос): сколько карточек показывать и сколько секунд
+# Telegram может кэшировать ответ на одинаковый запрос
+INLINE_RESULTS_LIMIT = 10
+INLINE_CACHE_TIME = 30
+
+# Проверка новых участников групп
+JOIN_BATCH_WINDOW = 0.5          # секунд копим входы перед одной общей проверкой
+JOIN_WARNING_INTERVAL = 10       # не чаще одного предупреждения в чат за столько секунд
+JOIN_WARN_LEVELS = (2, 3)        # о каких уровнях угрозы предупреждать
+
+# Состояния диалогов (FSM) на диске
+FSM_DB_PATH = "fsm_state.db"
+FSM_FLUSH_INTERVAL = 1.0         # секунд между пакетными сбросами на диск
+FSM_STATE_TTL = 24 * 3600        # брошенный диалог удаляется через столько секунд
+FSM_CACHE_TTL = 2.0              # с воркерами: секунд верить кэшу, потом перечитать с диска
+
+# Несколько процессов: координатор пишет в базу и публикует снапшот, воркеры читают его через mmap
+WORKERS = int(os.getenv("BOT_WORKERS", "0"))
+SNAPSHOT_PATH = "lookup.snapshot"
+SNAPSHOT_PUBLISH_INTERVAL = 1.0  # секунд между проверками журнала изменений
+
+# Остановка: общий срок на апдейты в обработке и очистку (воркеры, WAL);
+# супервизор ждёт на STOP_MARGIN дольше, потом kill
+SHUTDOWN_TIMEOUT = float(os.getenv("BOT_SHUTDOWN_TIMEOUT", "20"))
+
+# Логи: JSON в logs/<процесс>.log с ротацией по размеру и раз в сутки
+LOG_DIR = "logs"
+LOG_LEVEL = os.getenv("BOT_LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("BOT_LOG_FORMAT", "json")            # json или text
+LOG_CONSOLE = os.getenv("BOT_LOG_CONSOLE", "1") != "0"     # дублировать в stderr
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 7
+LOG_LOOKUP_SAMPLE = float(os.getenv("BOT_LOG_LOOKUP_SAMPLE", "0.1"))  # доля записей о проверках в логе
+
+# Кэш готовых карточек (записей)
+CARD_CACHE_SIZE = 4096
+
+# Фоновые дозаполнения после миграций: строк за одну короткую транзакцию и пауза между ними
+BACKFILL_BATCH_SIZE = 500
+BACKFILL_PAUSE = 0.05
+
+# Индексы в памяти (нечёткий, префиксный): при отставании от журнала больше чем
+# на столько изменений индекс перестраивается в потоке, а не догоняется на event loop
+INDEX_REBUILD_LAG = 5000
+
+# Импорт из Google таблицы: строк за одну транзакцию
+IMPORT_BATCH_SIZE = 500
+
+# Обслуживание базы (ANALYZE, checkpoint, incremental vacuum) в самом процессе бота
+MAINTENANCE_JITTER = 0.2             # разброс интервалов задач, доля
+MAINTENANCE_QUIET_HOURS = (3, 6)     # ночное окно для тяжёлых задач, часы по местному времени
+MAINTENANCE_QUIET_RATE = 30          # или меньше стольких апдейтов в минуту
+MAINTENANCE_VACUUM_PAGES = 1000      # страниц за один incremental_vacuum
+MAINTENANCE_FREE_RATIO = 0.2         # доля свободных страниц для перевода старой базы на auto_vacuum
+METRICS_LOG_INTERVAL = 300           # секунд между записями метрик в лог
+
+# HTTP-сессия Bot API (http_session.py)
+HTTP_POOL_SIZE = 100                 # соединений в пуле
+HTTP_KEEPALIVE = 60                  # секунд держать простаивающее соединение
+HTTP_DNS_TTL = 600                   # секунд помнить адрес api.telegram.org
+HTTP_TIMEOUT = 60                    # таймаут запроса по умолчанию, секунд
+HTTP_METHOD_TIMEOUTS = {             # свои таймауты методов (getUpdates берёт таймаут polling)
+    'answerInlineQuery': 10,         # после ~10 секунд Telegram ответ уже не примет
+    'answerCallbackQuery': 10,
+    'sendMessage': 20,
+    'sendPhoto': 60,
+    'sendDocument': 120,
+    'sendMediaGroup': 120,
+}
+BOT_API_URL = os.getenv("BOT_API_URL")                     # свой Bot API сервер, например http://localhost:8081
+BOT_API_LOCAL = os.getenv("BOT_API_LOCAL", "0") == "1"     # BOT_API_LOCAL=1, если сервер запущен с --local
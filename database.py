@@ -2,69 +2,272 @@ import sqlite3
 import os
 import json
 import logging
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+
+import migrations
+from config import DB_PATH, THREAT_LEVELS
+from utils import normalize_username, is_user_id
 
 logger = logging.getLogger(__name__)
 
+# Запись журнала изменений (CDC)
+Change = namedtuple('Change', 'seq op user_id old_username new_username admin_id created_at')
+Report = namedtuple('Report', 'id user_id reporter_id reason proof threat_level created_at')
+
+
+def report_weight(threat_level):
+    """Вклад одной жалобы в рейтинг угрозы"""
+    return THREAT_LEVELS.get(threat_level, THREAT_LEVELS[3])['weight']
+
 
 class Database:
-    def __init__(self):
-        # Всегда используем одну и ту же базу
-        self.db_path = "truston_scam.db"
-        logger.info(f"📁 База данных: {self.db_path}")
+    def __init__(self, db_path=DB_PATH, readonly=False, migrate=True):
+        """migrate=False - ещё одно соединение записи к базе, которую уже открыл
+        основной Database (миграции и дозаполнения запускает только он)"""
+        self.db_path = db_path
+        if readonly:
+            # Диагностика, снапшоты, воркеры кластера: без DDL и миграций.
+            # Снапшот открывает такое соединение на каждую сборку - в лог не пишем
+            logger.debug(f"📁 База данных: {self.db_path} (только чтение)")
+            self.conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False)
+            self.cursor = self.conn.cursor()
+            return
 
+        logger.info(f"📁 База данных: {self.db_path}")
         self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        # Новая база создаётся с incremental vacuum (для существующей прагма ничего не меняет,
+        # её переводит maintenance.py)
+        self.conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        # WAL: читатели из других процессов не блокируются записью
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA busy_timeout=5000')
         self.cursor = self.conn.cursor()
-        self.create_tables()
+        if migrate:
+            self.create_tables()
 
     def create_tables(self):
-        """Создает таблицы если их нет"""
-        self.cursor.execute('''
-                            CREATE TABLE IF NOT EXISTS scammers
-                            (
-                                id
-                                INTEGER
-                                PRIMARY
-                                KEY
-                                AUTOINCREMENT,
-                                user_id
-                                TEXT
-                                UNIQUE
-                                NOT
-                                NULL,
-                                username
-                                TEXT,
-                                threat_level
-                                INTEGER
-                                DEFAULT
-                                3,
-                                reason
-                                TEXT,
-                                proof
-                                TEXT,
-                                added_date
-                                TIMESTAMP
-                                DEFAULT
-                                CURRENT_TIMESTAMP
-                            )
-                            ''')
-        self.conn.commit()
-        logger.info("✅ Таблицы созданы")
+        """Доводит схему до последней версии и запускает фоновые дозаполнения"""
+        version = migrations.migrate(self.conn)
+        self.backfill_thread = migrations.start_backfills(self.conn, self.db_path)
+        logger.info(f"✅ Схема базы: версия {version}")
 
-    def add_scammer(self, user_id, username, threat_level, reason, proof, added_by):
-        """Добавляет пользователя в базу"""
+    @contextmanager
+    def transaction(self):
+        """Транзакция записи: изменения и журнал фиксируются вместе"""
+        # BEGIN IMMEDIATE сразу берёт блокировку записи, поэтому порядок seq
+        # в журнале совпадает с порядком коммитов даже между процессами
+        self.cursor.execute('BEGIN IMMEDIATE')
         try:
-            self.cursor.execute('''
-                INSERT OR REPLACE INTO scammers 
-                (user_id, username, threat_level, reason, proof)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (user_id, username, threat_level, reason, proof))
+            yield self.cursor
+        except Exception:
+            self.conn.rollback()
+            raise
+        else:
             self.conn.commit()
+
+    def _log_change(self, op, user_id, old_username, new_username, admin_id):
+        """Дописывает запись в журнал изменений (внутри открытой транзакции)"""
+        self.cursor.execute('''
+            INSERT INTO changes (op, user_id, old_username, new_username, admin_id)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (op, user_id, old_username, new_username, admin_id))
+
+    def add_scammer(self, user_id, username, threat_level, reason, proof, added_by, files=()):
+        """Добавляет жалобу на пользователя; повторная жалоба не затирает прошлые.
+        Файлы доказательств [(file_unique_id, file_id, file_type)] пишутся в той же транзакции"""
+        if not is_user_id(user_id):
+            logger.error(f"❌ Недопустимый ID: {user_id}")
+            return False
+        try:
+            with self.transaction() as cur:
+                cur.execute('SELECT username FROM scammers WHERE user_id = ?', (user_id,))
+                old = cur.fetchone()
+                if old:
+                    self._adopt_legacy_report(user_id)
+                # Дата внесения и накопленный рейтинг сохраняются,
+                # вердикт пересчитывается по всем жалобам ниже
+                cur.execute('''
+                    INSERT INTO scammers (user_id, username, threat_level, reason, proof)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (user_id) DO UPDATE SET
+                        username = excluded.username,
+                        threat_level = excluded.threat_level,
+                        reason = excluded.reason,
+                        proof = excluded.proof
+                ''', (user_id, username, threat_level, reason, proof))
+                self._insert_report(user_id, added_by, reason, proof, threat_level)
+                self._refresh_verdict(user_id)
+                self._record_alias(user_id, username, 'admin')
+                if files:
+                    self._insert_proof_files(user_id, files, added_by)
+                self._log_change('update' if old else 'insert', user_id,
+                                 old[0] if old else None, username, added_by)
             logger.info(f"✅ Добавлен: ID={user_id}")
             return True
         except Exception as e:
             logger.error(f"❌ Ошибка: {e}")
             return False
 
+    def import_scammers(self, records, added_by=None):
+        """Импортирует записи (user_id, username, threat_level, reason, proof).
+
+        Повторный импорт того же источника не плодит жалобы: новые ID
+        добавляются, у известных обновляется только юзернейм.
+        Возвращает количество добавленных.
+        """
+        added = 0
+        with self.transaction() as cur:
+            for user_id, username, threat_level, reason, proof in records:
+                user_id = str(user_id).strip()
+                username = (username or '').strip().replace('@', '')
+                if not is_user_id(user_id):
+                    continue
+                cur.execute('SELECT username FROM scammers WHERE user_id = ?', (user_id,))
+                old = cur.fetchone()
+                if old:
+                    if username and normalize_username(username) != normalize_username(old[0]):
+                        self._rename(user_id, old[0], username, 'import', added_by)
+                    continue
+                cur.execute('''
+                    INSERT INTO scammers (user_id, username, threat_level, reason, proof)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (user_id, username, threat_level, reason, proof))
+                self._insert_report(user_id, added_by, reason, proof, threat_level)
+                self._record_alias(user_id, username, 'import')
+                self._log_change('insert', user_id, None, username, added_by)
+                added += 1
+        # Итог импорта пишет вызывающий (импорт идёт пачками)
+        logger.debug(f"📥 Импортировано: {added}")
+        return added
+
+    # ============ ИСТОРИЯ ЮЗЕРНЕЙМОВ ============
+    def _record_alias(self, user_id, username, source):
+        """Запоминает юзернейм за user_id (внутри открытой транзакции)"""
+        if not username:
+            return
+        self.cursor.execute('''
+            INSERT INTO username_aliases (username_norm, username, user_id, source)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (username_norm) DO UPDATE SET
+                username = excluded.username,
+                user_id = excluded.user_id,
+                source = excluded.source,
+                last_seen = CURRENT_TIMESTAMP
+        ''', (normalize_username(username), username, user_id, source))
+
+    def _rename(self, user_id, old_username, new_username, source, admin_id=None):
+        """Меняет текущий юзернейм записи, старый остаётся в истории"""
+        self._record_alias(user_id, old_username, source)
+        self._record_alias(user_id, new_username, source)
+        self.cursor.execute('UPDATE scammers SET username = ? WHERE user_id = ?', (new_username, user_id))
+        self._log_change('rename', user_id, old_username, new_username, admin_id)
+
+    def observe_username(self, user_id, username):
+        """Фиксирует юзернейм, под которым пользователь из базы пишет боту сейчас"""
+        if not username:
+            return False
+        user_id = str(user_id)
+        row = self.conn.execute('SELECT username FROM scammers WHERE user_id = ?', (user_id,)).fetchone()
+        if not row or normalize_username(row[0]) == normalize_username(username):
+            return False
+        with self.transaction():
+            self._rename(user_id, row[0], username, 'observed')
+        logger.info(f"🔁 Смена юзернейма: ID={user_id} @{row[0]} -> @{username}")
+        return True
+
+    def get_aliases(self, user_id):
+        """Все юзернеймы пользователя в порядке появления"""
+        rows = self.conn.execute('''
+            SELECT username FROM username_aliases
+            WHERE user_id = ?
+            ORDER BY first_seen, rowid
+        ''', (user_id,)).fetchall()
+        return [row[0] for row in rows]
+
+    def _insert_report(self, user_id, reporter_id, reason, proof, threat_level):
+        """Сохраняет жалобу и обновляет рейтинг (внутри открытой транзакции)"""
+        self.cursor.execute('''
+            INSERT INTO reports (user_id, reporter_id, reason, proof, threat_level)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (user_id, reporter_id, reason, proof, threat_level))
+        self.cursor.execute('''
+            UPDATE scammers SET reports_count = reports_count + 1, score = score + ?
+            WHERE user_id = ?
+        ''', (report_weight(threat_level), user_id))
+
+    def _adopt_legacy_report(self, user_id):
+        """Переносит старую запись в reports, если дозаполнение до неё ещё не дошло
+        (внутри открытой транзакции, до изменения строки scammers).
+
+        Иначе новая жалоба стала бы единственной: вердикт пересчитался бы по
+        ней, а дозаполнение пропустило бы пользователя с жалобами"""
+        self.cursor.execute('''
+            INSERT INTO reports (user_id, reason, proof, threat_level, created_at)
+            SELECT s.user_id, s.reason, s.proof, s.threat_level, s.added_date
+            FROM scammers s
+            WHERE s.user_id = ?
+              AND NOT EXISTS (SELECT 1 FROM reports r WHERE r.user_id = s.user_id)
+        ''', (user_id,))
+        if not self.cursor.rowcount:
+            return
+        self.cursor.execute('SELECT threat_level FROM scammers WHERE user_id = ?', (user_id,))
+        threat_level = self.cursor.fetchone()[0]
+        self.cursor.execute('UPDATE scammers SET reports_count = 1, score = ? WHERE user_id = ?',
+                            (report_weight(threat_level), user_id))
+
+    def _refresh_verdict(self, user_id):
+        """Вердикт записи - по самой тяжёлой жалобе (внутри открытой транзакции).
+        Возвращает False, если жалоб не осталось"""
+        # Уровни растут вместе с угрозой: одна жалоба "проверенный" после
+        # нескольких "мошенник" не делает запись зелёной
+        self.cursor.execute('''
+            SELECT threat_level, reason, proof FROM reports
+            WHERE user_id = ?
+            ORDER BY threat_level DESC, id DESC
+            LIMIT 1
+        ''', (user_id,))
+        strongest = self.cursor.fetchone()
+        if strongest is None:
+            return False
+        self.cursor.execute('UPDATE scammers SET threat_level = ?, reason = ?, proof = ? WHERE user_id = ?',
+                            (*strongest, user_id))
+        return True
+
+    def get_reports(self, user_id):
+        """Все жалобы на пользователя, новые первыми"""
+        rows = self.conn.execute('''
+            SELECT id, user_id, reporter_id, reason, proof, threat_level, created_at
+            FROM reports
+            WHERE user_id = ?
+            ORDER BY id DESC
+        ''', (user_id,)).fetchall()
+        return [Report(*row) for row in rows]
+
+    def delete_report(self, report_id, deleted_by=None):
+        """Удаляет одну жалобу и вычитает её из рейтинга; с последней жалобой удаляется запись"""
+        with self.transaction() as cur:
+            cur.execute('SELECT user_id, threat_level FROM reports WHERE id = ?', (report_id,))
+            report = cur.fetchone()
+            if not report:
+                return False
+            user_id, threat_level = report
+            cur.execute('DELETE FROM reports WHERE id = ?', (report_id,))
+            cur.execute('''
+                UPDATE scammers SET reports_count = reports_count - 1, score = score - ?
+                WHERE user_id = ?
+            ''', (report_weight(threat_level), user_id))
+            cur.execute('SELECT username FROM scammers WHERE user_id = ?', (user_id,))
+            row = cur.fetchone()
+            username = row[0] if row else None
+            if not self._refresh_verdict(user_id):
+                self._delete_record(user_id, username, deleted_by)
+                logger.info(f"🗑️ Удалена последняя жалоба, запись ID={user_id} удалена")
+                return True
+            self._log_change('update', user_id, username, username, deleted_by)
+        return True
+
     def find_user(self, query):
         """Ищет пользователя по ID или username"""
         query = query.strip().replace('@', '')
@@ -72,7 +275,8 @@ class Database:
         # Ищем по ID
         if query.isdigit():
             self.cursor.execute('''
-                                SELECT user_id, username, threat_level, reason, proof, added_date
+                                SELECT user_id, username, threat_level, reason, proof, added_date,
+                                       reports_count, score
                                 FROM scammers
                                 WHERE user_id = ?
                                 ''', (query,))
@@ -80,9 +284,24 @@ class Database:
             if result:
                 return result, 'id'
 
+        # Ищем по истории юзернеймов (точное совпадение, уникальный индекс)
+        self.cursor.execute('''
+                            SELECT s.user_id, s.username, s.threat_level, s.reason, s.proof, s.added_date,
+                                   s.reports_count, s.score
+                            FROM username_aliases a
+                            JOIN scammers s ON s.user_id = a.user_id
+                            WHERE a.username_norm = ?
+                            ''', (normalize_username(query),))
+        result = self.cursor.fetchone()
+        if result:
+            if normalize_username(result[1]) == normalize_username(query):
+                return result, 'username'
+            return result, 'alias'
+
         # Ищем по username
         self.cursor.execute('''
-                            SELECT user_id, username, threat_level, reason, proof, added_date
+                            SELECT user_id, username, threat_level, reason, proof, added_date,
+                                   reports_count, score
                             FROM scammers
                             WHERE username LIKE ?
                             ''', (f"%{query}%",))
@@ -92,6 +311,10 @@ class Database:
 
         return None, None
 
+    def count_scammers(self):
+        """Число записей (для статистики - без выгрузки всей таблицы)"""
+        return self.conn.execute('SELECT COUNT(*) FROM scammers').fetchone()[0]
+
     def get_all_scammers(self):
         """Получает все записи"""
         self.cursor.execute('''
@@ -101,11 +324,174 @@ class Database:
                             ''')
         return self.cursor.fetchall()
 
-    def delete_scammer(self, user_id):
+    def get_user_keys(self):
+        """Пары (user_id, username) для построения индексов в памяти"""
+        return self.conn.execute('SELECT user_id, username FROM scammers')
+
+    def get_scammers(self, user_ids):
+        """Записи по списку ID (в том же порядке), запросами по индексу пачками"""
+        by_id = {}
+        user_ids = [str(user_id) for user_id in user_ids]
+        # SQLite ограничивает число параметров в запросе
+        for start in range(0, len(user_ids), 500):
+            chunk = user_ids[start:start + 500]
+            placeholders = ', '.join('?' * len(chunk))
+            rows = self.conn.execute(f'''
+                SELECT user_id, username, threat_level, reason, proof, added_date,
+                       reports_count, score
+                FROM scammers
+                WHERE user_id IN ({placeholders})
+            ''', chunk).fetchall()
+            by_id.update((row[0], row) for row in rows)
+        return [by_id[user_id] for user_id in user_ids if user_id in by_id]
+
+    def get_snapshot_rows(self):
+        """Все записи с историей юзернеймов (через запятую) для снапшота"""
+        return self.conn.execute('''
+            SELECT s.user_id, s.username, s.threat_level, s.reason, s.proof, s.added_date,
+                   s.reports_count, s.score,
+                   (SELECT group_concat(a.username, ',')
+                    FROM (SELECT username FROM username_aliases
+                          WHERE user_id = s.user_id
+                          ORDER BY first_seen, rowid) a)
+            FROM scammers s
+        ''')
+
+    def delete_scammer(self, user_id, deleted_by=None):
         """Удаляет запись"""
+        with self.transaction() as cur:
+            cur.execute('SELECT username FROM scammers WHERE user_id = ?', (user_id,))
+            old = cur.fetchone()
+            if not old:
+                return False
+            self._delete_record(user_id, old[0], deleted_by)
+        return True
+
+    def _delete_record(self, user_id, username, deleted_by):
+        """Удаляет запись с жалобами и привязками файлов (внутри открытой транзакции)"""
         self.cursor.execute('DELETE FROM scammers WHERE user_id = ?', (user_id,))
-        self.conn.commit()
-        return self.cursor.rowcount > 0
+        self.cursor.execute('DELETE FROM reports WHERE user_id = ?', (user_id,))
+        self.cursor.execute('DELETE FROM proof_links WHERE user_id = ?', (user_id,))
+        self._log_change('delete', user_id, username, None, deleted_by)
+
+    # ============ ДОКАЗАТЕЛЬСТВА ============
+    def add_proof_files(self, user_id, files, added_by=None):
+        """Прикрепляет файлы [(file_unique_id, file_id, file_type)] к записи.
+        Возвращает число новых привязок"""
+        with self.transaction():
+            return self._insert_proof_files(user_id, files, added_by)
+
+    def _insert_proof_files(self, user_id, files, added_by):
+        """Сохраняет файлы и привязки к записи (внутри открытой транзакции)"""
+        self.cursor.executemany('''
+            INSERT INTO proof_files (file_unique_id, file_id, file_type, uploaded_by)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (file_unique_id) DO NOTHING
+        ''', [(unique_id, file_id, file_type, added_by) for unique_id, file_id, file_type in files])
+        before = self.conn.total_changes
+        self.cursor.executemany('''
+            INSERT OR IGNORE INTO proof_links (user_id, file_unique_id, added_by)
+            VALUES (?, ?, ?)
+        ''', [(user_id, unique_id, added_by) for unique_id, _, _ in files])
+        return self.conn.total_changes - before
+
+    def get_proof_files(self, user_id):
+        """[(file_id, file_type)] в порядке прикрепления"""
+        return self.conn.execute('''
+            SELECT f.file_id, f.file_type
+            FROM proof_links l
+                     JOIN proof_files f ON f.file_unique_id = l.file_unique_id
+            WHERE l.user_id = ?
+            ORDER BY l.rowid
+        ''', (user_id,)).fetchall()
+
+    # ============ ЖУРНАЛ ИЗМЕНЕНИЙ ============
+    def get_changes(self, after_seq=0, limit=1000):
+        """Возвращает изменения с seq > after_seq по порядку"""
+        rows = self.conn.execute('''
+            SELECT seq, op, user_id, old_username, new_username, admin_id, created_at
+            FROM changes
+            WHERE seq > ?
+            ORDER BY seq
+            LIMIT ?
+        ''', (after_seq, limit)).fetchall()
+        return [Change(*row) for row in rows]
+
+    def checkpoint(self):
+        """Переносит WAL в основной файл и обрезает его (перед остановкой)"""
+        busy, log_pages, moved = self.conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchone()
+        logger.info(f"💾 Checkpoint WAL: перенесено страниц {moved} из {log_pages}" + (" (база занята)" if busy else ""))
+
+    def get_last_change_seq(self):
+        """Последний seq журнала (0 если журнал пуст)"""
+        row = self.conn.execute('SELECT MAX(seq) FROM changes').fetchone()
+        return row[0] or 0
+
+
+@contextmanager
+def read_transaction(db_path):
+    """Отдельное соединение только для чтения с открытой транзакцией чтения.
+
+    Для полной загрузки индексов в потоке: общим соединением в это время
+    пользуются обработчики, а seq журнала и строки, прочитанные внутри,
+    согласованы между собой"""
+    reader = Database(db_path, readonly=True)
+    try:
+        reader.conn.execute('BEGIN')
+        yield reader
+    finally:
+        reader.conn.close()
+
+
+class ChangeLogReader:
+    """Читает журнал изменений начиная с курсора.
+
+    Потребитель (кэш, индекс, реплика, другой процесс бота) один раз делает
+    полную загрузку, а дальше применяет только дельты из poll().
+    Курсор нужно запомнить ДО полной загрузки: повторное применение
+    изменения безопасно, а пропуск - нет.
+    """
+
+    def __init__(self, database, cursor=0):
+        self.database = database
+        self.cursor = cursor
+
+    def poll(self, limit=1000):
+        """Возвращает новые изменения и сдвигает курсор"""
+        changes = self.database.get_changes(self.cursor, limit)
+        if changes:
+            self.cursor = changes[-1].seq
+        return changes
+
+
+class LazyDatabase:
+    """Открывает базу при первом обращении, а не при импорте модуля.
+
+    Импорт handlers и остальных модулей ничего не открывает и не выполняет
+    DDL; main запускает открытие в потоке параллельно с getMe.
+    """
+
+    def __init__(self, factory=Database):
+        self._factory = factory
+        self._instance = None
+        self._lock = threading.Lock()
+
+    def configure(self, factory):
+        """Подменяет способ открытия (воркер кластера открывает базу только для чтения)"""
+        with self._lock:
+            if self._instance is not None:
+                raise RuntimeError("База уже открыта")
+            self._factory = factory
+
+    def instance(self):
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    self._instance = self._factory()
+        return self._instance
+
+    def __getattr__(self, name):
+        return getattr(self.instance(), name)
 
 
-db = Database()
\ No newline at end of file
+db = LazyDatabase()
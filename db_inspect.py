@@ -0,0 +1,237 @@
+"""
+Диагностика базы: планы запросов, размеры таблиц, задержки на живом файле
+
+python db_inspect.py [--db truston_scam.db] [--samples 200]
+
+1. Запросы: методы Database вызываются на пустой базе в памяти, каждый
+   выполненный SQL перехватывается (set_trace_callback). Для каждого
+   запроса EXPLAIN QUERY PLAN строится уже на живой базе - её статистика и
+   индексы решают, какой будет план. Полный просмотр таблицы (SCAN)
+   помечается, кроме методов, которые по смыслу читают всю таблицу.
+2. Размеры: страницы таблиц и индексов через dbstat; если SQLite собран без
+   него - только общий размер файла. Число строк - из sqlite_stat1
+   (его заполняет ANALYZE в maintenance.py), без COUNT(*) по таблицам.
+3. Задержки: случайные записи выбираются по rowid, и настоящие методы
+   Database (find_user и др.) выполняются на живой базе, открытой только
+   для чтения.
+
+Тот же отчёт админ получает командой /dbinspect.
+"""
+
+import argparse
+import logging
+import os
+import random
+import re
+import sqlite3
+import statistics
+import time
+
+from config import DB_PATH
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+# Методы и аргументы для перехвата запросов; порядок важен (запись -> чтение -> удаление)
+SCENARIO = [
+    ('add_scammer', ('1001', 'alice', 3, 'причина', 'доказательство', 1)),
+    ('add_scammer', ('1001', 'alice', 2, 'повторная жалоба', '', 2)),
+    ('import_scammers', ([('1002', 'bob', 3, '', '')],)),
+    ('observe_username', ('1001', 'alice_new')),
+    ('find_user', ('1001',)),
+    ('find_user', ('alice_new',)),
+    ('find_user', ('ali',)),
+    ('get_aliases', ('1001',)),
+    ('get_reports', ('1001',)),
+    ('get_scammers', (['1001', '1002'],)),
+    ('add_proof_files', ('1001', [('unique1', 'file1', 'photo')], 1)),
+    ('get_proof_files', ('1001',)),
+    ('count_scammers', ()),
+    ('get_all_scammers', ()),
+    ('get_user_keys', ()),
+    ('get_snapshot_rows', ()),
+    ('get_changes', (0,)),
+    ('get_last_change_seq', ()),
+    ('delete_report', (1, 1)),
+    ('delete_scammer', ('1002', 1)),
+]
+
+# Эти методы читают всю таблицу намеренно (выгрузки, построение индексов)
+EXPECTED_SCANS = {'count_scammers', 'get_all_scammers', 'get_user_keys', 'get_snapshot_rows'}
+
+_SKIP = re.compile(r'^\s*(BEGIN|COMMIT|ROLLBACK|PRAGMA|CREATE|ALTER|--)', re.IGNORECASE)
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+
+
+def capture_statements():
+    """[(метод, sql)] - все запросы методов Database из SCENARIO, без повторов"""
+    database = Database(':memory:')
+    current = [None]
+    seen = set()
+    statements = []
+
+    def trace(sql):
+        if _SKIP.match(sql):
+            return
+        key = (current[0], ' '.join(_LITERALS.sub('?', sql).split()))
+        if key not in seen:
+            seen.add(key)
+            statements.append((current[0], sql))
+
+    database.conn.set_trace_callback(trace)
+    for method, args in SCENARIO:
+        current[0] = method
+        result = getattr(database, method)(*args)
+        if isinstance(result, sqlite3.Cursor):
+            result.fetchall()
+    database.conn.set_trace_callback(None)
+    database.conn.close()
+    return statements
+
+
+def explain(conn, sql):
+    """Строки плана; полный просмотр - строки, начинающиеся со SCAN"""
+    rows = conn.execute('EXPLAIN QUERY PLAN ' + sql).fetchall()
+    return [row[-1] for row in rows]
+
+
+def _is_scan(detail):
+    return detail.startswith('SCAN ') and 'CONSTANT ROW' not in detail
+
+
+def check_plans(conn):
+    """[(метод, sql, план, есть ли лишний полный просмотр)]"""
+    results = []
+    for method, sql in capture_statements():
+        try:
+            plan = explain(conn, sql)
+        except sqlite3.Error as e:
+            plan = [f"ошибка: {e}"]
+        flagged = method not in EXPECTED_SCANS and any(_is_scan(detail) for detail in plan)
+        results.append((method, sql, plan, flagged))
+    return results
+
+
+def table_sizes(conn):
+    """[(имя, байт, страниц)] по убыванию размера или None без dbstat"""
+    try:
+        return conn.execute('''
+            SELECT name, SUM(pgsize), COUNT(*) FROM dbstat
+            GROUP BY name ORDER BY SUM(pgsize) DESC
+        ''').fetchall()
+    except sqlite3.OperationalError:
+        return None
+
+
+def row_estimates(conn):
+    """{таблица: строк} из sqlite_stat1 (пусто, если ANALYZE ещё не запускался)"""
+    try:
+        rows = conn.execute('SELECT tbl, stat FROM sqlite_stat1').fetchall()
+    except sqlite3.OperationalError:
+        return {}
+    estimates = {}
+    # Первое число stat - строк в таблице, для любого её индекса
+    for table, stat in rows:
+        estimates.setdefault(table, int(stat.split()[0]))
+    return estimates
+
+
+def sample_rows(conn, samples):
+    """Случайные (user_id, username) по rowid - без выгрузки таблицы"""
+    max_id = conn.execute('SELECT MAX(id) FROM scammers').fetchone()[0]
+    if not max_id:
+        return []
+    rows = []
+    for _ in range(samples):
+        row = conn.execute('SELECT user_id, username FROM scammers WHERE id >= ? ORDER BY id LIMIT 1',
+                           (random.randint(1, max_id),)).fetchone()
+        if row:
+            rows.append(row)
+    return rows
+
+
+def measure_latencies(database, samples):
+    """{проба: [мс]} для настоящих методов Database на живой базе"""
+    rows = sample_rows(database.conn, samples)
+    probes = {
+        'find_user по ID': [user_id for user_id, _ in rows],
+        'find_user по юзернейму': [username for _, username in rows if username],
+        # Промах проходит все ветки поиска, включая LIKE
+        'find_user промах': [f"nobody_{random.randrange(10 ** 9)}" for _ in rows],
+    }
+    timings = {}
+    for name, queries in probes.items():
+        for query in queries:
+            started = time.perf_counter()
+            database.find_user(query)
+            timings.setdefault(name, []).append((time.perf_counter() - started) * 1000)
+    for name, method in (('get_aliases', database.get_aliases), ('get_proof_files', database.get_proof_files)):
+        for user_id, _ in rows:
+            started = time.perf_counter()
+            method(user_id)
+            timings.setdefault(name, []).append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def _percentile(values, q):
+    if len(values) < 2:
+        return values[0]
+    return statistics.quantiles(values, n=100, method='inclusive')[q - 1]
+
+
+def report(db_path=DB_PATH, samples=200, verbose=True):
+    """Отчёт целиком одним текстом"""
+    if not os.path.exists(db_path):
+        return f"❌ База данных {db_path} не найдена!"
+    database = Database(db_path, readonly=True)
+    conn = database.conn
+    lines = [f"🔍 База: {db_path}, {os.path.getsize(db_path):,} байт"]
+    try:
+        lines.append("\n📐 Планы запросов:")
+        flagged = 0
+        for method, sql, plan, scan in check_plans(conn):
+            flagged += scan
+            if scan or verbose:
+                lines.append(f"{'⚠️' if scan else '✅'} {method}: {' '.join(sql.split())[:120]}")
+                lines.extend(f"      {detail}" for detail in plan)
+        lines.append(f"Полных просмотров вне выгрузок: {flagged}")
+
+        lines.append("\n💾 Таблицы и индексы:")
+        estimates = row_estimates(conn)
+        sizes = table_sizes(conn)
+        if sizes is None:
+            page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+            page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+            lines.append(f"dbstat недоступен; всего {page_count} страниц по {page_size} байт")
+            sizes = [(name, None, None) for name, in
+                     conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'index')")]
+        for name, size, pages in sizes:
+            rows = f", ~{estimates[name]:,} строк" if name in estimates else ""
+            volume = f"{size:,} байт ({pages} стр.)" if size is not None else "размер неизвестен"
+            lines.append(f"• {name}: {volume}{rows}")
+        free_pages = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        lines.append(f"Свободных страниц: {free_pages}")
+
+        lines.append(f"\n⏱ Задержки (мс, выборка до {samples}):")
+        timings = measure_latencies(database, samples)
+        if not timings:
+            lines.append("Записей нет - измерять нечего")
+        for name, values in timings.items():
+            lines.append(f"• {name}: p50 {_percentile(values, 50):.3f}, p95 {_percentile(values, 95):.3f}, "
+                         f"max {max(values):.3f} (n={len(values)})")
+    finally:
+        conn.close()
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Диагностика базы TRUSTON")
+    parser.add_argument("--db", default=DB_PATH, help="файл базы")
+    parser.add_argument("--samples", type=int, default=200, help="сколько записей замерять")
+    parser.add_argument("--flagged", action="store_true", help="показывать только планы с полным просмотром")
+    args = parser.parse_args()
+    print(report(args.db, args.samples, verbose=not args.flagged))
+
+
+if __name__ == "__main__":
+    main()
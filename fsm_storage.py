@@ -0,0 +1,202 @@
+"""
+Хранилище состояний FSM на SQLite с кэшем в памяти
+
+Чтение состояния (state.get_state() на каждое сообщение) идёт из словаря
+в памяти; в SQLite ходим только за ключом, которого ещё нет в кэше.
+Изменения помечаются грязными и сбрасываются на диск пачкой одной
+транзакцией раз в flush_interval секунд, так что диалог добавления
+записи переживает перезапуск супервизором. Брошенные диалоги старше
+state_ttl удаляются.
+"""
+
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
+
+logger = logging.getLogger(__name__)
+
+# Чистые записи, к которым давно не обращались, выкидываются из памяти
+EVICT_AFTER = 600
+
+
+class _Record:
+    __slots__ = ('state', 'data', 'updated_at', 'touched_at')
+
+    def __init__(self, state=None, data=None, updated_at=0.0):
+        self.state = state
+        self.data = data or {}
+        self.updated_at = updated_at
+        self.touched_at = time.monotonic()
+
+
+class SQLiteStorage(BaseStorage):
+    def __init__(self, db_path="fsm_state.db", flush_interval=1.0, state_ttl=24 * 3600, cache_ttl=None):
+        """cache_ttl - сколько секунд верить кэшу без перечитывания с диска.
+        None - всегда верить (один процесс); при нескольких процессах
+        на одном файле стоит поставить несколько секунд."""
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.state_ttl = state_ttl
+        self.cache_ttl = cache_ttl
+
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS fsm_states
+            (
+                key        TEXT PRIMARY KEY,
+                state      TEXT,
+                data       TEXT,
+                updated_at REAL NOT NULL
+            )
+        ''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_fsm_states_updated_at ON fsm_states (updated_at)')
+        self.conn.commit()
+        # Запись идёт из фонового потока, поэтому читаем через отдельное соединение
+        self.read_conn = sqlite3.connect(db_path, check_same_thread=False)
+
+        self.cache = {}
+        self.dirty = set()
+        self.flush_task = None
+        self.flush_lock = asyncio.Lock()
+        self.expired_at = 0.0
+        self.close_deferred = False
+
+    @staticmethod
+    def _key(key: StorageKey):
+        return ':'.join(str(part) for part in (
+            key.bot_id, key.chat_id, key.user_id, key.thread_id,
+            key.business_connection_id, key.destiny
+        ))
+
+    def _load(self, key):
+        """Запись из кэша, при промахе - одно чтение по первичному ключу"""
+        record = self.cache.get(key)
+        now = time.monotonic()
+        if record is not None and (self.cache_ttl is None or key in self.dirty
+                                   or now - record.touched_at < self.cache_ttl):
+            record.touched_at = now
+        else:
+            row = self.read_conn.execute(
+                'SELECT state, data, updated_at FROM fsm_states WHERE key = ?', (key,)
+            ).fetchone()
+            record = _Record(row[0], json.loads(row[1]) if row[1] else {}, row[2]) if row else _Record()
+            self.cache[key] = record
+
+        # Брошенный диалог - как будто его не было
+        if record.updated_at and time.time() - record.updated_at > self.state_ttl:
+            record.state, record.data, record.updated_at = None, {}, 0.0
+            self._mark_dirty(key)
+        return record
+
+    def _mark_dirty(self, key):
+        self.dirty.add(key)
+        if self.flush_task is None:
+            self.flush_task = asyncio.create_task(self._flush_loop())
+
+    def _touch(self, key, record):
+        record.updated_at = time.time()
+        self._mark_dirty(key)
+
+    async def set_state(self, key: StorageKey, state=None) -> None:
+        key = self._key(key)
+        record = self._load(key)
+        record.state = state.state if isinstance(state, State) else state
+        self._touch(key, record)
+
+    async def get_state(self, key: StorageKey):
+        return self._load(self._key(key)).state
+
+    async def set_data(self, key: StorageKey, data) -> None:
+        key = self._key(key)
+        record = self._load(key)
+        record.data = dict(data)
+        self._touch(key, record)
+
+    async def get_data(self, key: StorageKey):
+        return self._load(self._key(key)).data.copy()
+
+    # ============ СБРОС НА ДИСК ============
+    async def _flush_loop(self):
+        try:
+            while True:
+                await asyncio.sleep(self.flush_interval)
+                await self.flush()
+        except asyncio.CancelledError:
+            pass
+
+    async def flush(self):
+        """Сбрасывает все грязные записи одной транзакцией"""
+        async with self.flush_lock:
+            now = time.time()
+            upserts, deletes = [], []
+            for key in self.dirty:
+                record = self.cache[key]
+                if record.state is None and not record.data:
+                    deletes.append((key,))
+                else:
+                    upserts.append((key, record.state, json.dumps(record.data, ensure_ascii=False),
+                                    record.updated_at))
+            self.dirty.clear()
+
+            # Раз в минуту чистим брошенные диалоги на диске и старые записи в памяти
+            expire = now - self.expired_at > 60
+            if expire:
+                self.expired_at = now
+                self._evict()
+            if upserts or deletes or expire:
+                await asyncio.to_thread(self._write, upserts, deletes, now - self.state_ttl if expire else None)
+            if upserts or deletes:
+                logger.debug(f"💾 FSM: записано {len(upserts)}, удалено {len(deletes)}")
+
+    def _write(self, upserts, deletes, expire_before):
+        with self.conn:
+            self.conn.executemany('''
+                INSERT INTO fsm_states (key, state, data, updated_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET
+                    state = excluded.state,
+                    data = excluded.data,
+                    updated_at = excluded.updated_at
+            ''', upserts)
+            self.conn.executemany('DELETE FROM fsm_states WHERE key = ?', deletes)
+            if expire_before is not None:
+                self.conn.execute('DELETE FROM fsm_states WHERE updated_at < ?', (expire_before,))
+
+    def _evict(self):
+        """Выкидывает из памяти давно не нужные чистые записи"""
+        border = time.monotonic() - EVICT_AFTER
+        stale = [key for key, record in self.cache.items()
+                 if record.touched_at < border and key not in self.dirty]
+        for key in stale:
+            del self.cache[key]
+
+    def defer_close(self):
+        """Дальше close() только сбрасывает изменения, закрывает хранилище dispose().
+
+        aiogram закрывает FSM первым обработчиком shutdown, раньше, чем
+        GracefulShutdown дождётся апдейтов в работе (shutdown.py)"""
+        self.close_deferred = True
+
+    async def close(self) -> None:
+        if self.close_deferred:
+            await self.flush()
+            return
+        await self.dispose()
+
+    async def dispose(self):
+        """Сбрасывает изменения и закрывает соединения"""
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+            self.flush_task = None
+        await self.flush()
+        # Переносим WAL в основной файл, чтобы следующий старт не разбирал журнал
+        self.conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        self.read_conn.close()
+        self.conn.close()
+        logger.info("💾 Состояния FSM сохранены")
@@ -0,0 +1,270 @@
+"""
+Нечёткий поиск похожих юзернеймов (trust0n_suppport -> truston_support)
+
+Юзернейм сводится к "скелету": нижний регистр, кириллические и цифровые
+двойники заменены латиницей, повторы букв схлопнуты. Кандидаты ищутся по
+триграммам скелета: для каждой пары (триграмма, длина скелета) хранится
+массив номеров записей (array('I')), а сами записи - два плоских списка.
+Похожий юзернейм отличается по длине не больше чем на допустимое
+расстояние и делит с запросом большую часть триграмм. Списки
+просматриваются от редких триграмм к частым, всего не больше SCAN_LIMIT
+номеров, и расстояние считается только для MAX_CANDIDATES кандидатов с
+наибольшим числом общих триграмм. Поэтому поиск занимает миллисекунды и
+не зависит ни от размера базы, ни от того, сколько имён начинаются
+одинаково (crypto_...).
+
+Индекс строится в потоке (warm) по отдельному соединению только для
+чтения, до готовности поиск возвращает []. find_similar применяет дельты
+журнала на event loop, а сам поиск (только память) выполняет в потоке.
+Если журнал ушёл вперёд больше чем на INDEX_REBUILD_LAG изменений, индекс
+перестраивается в потоке целиком.
+"""
+
+import asyncio
+import logging
+import re
+import time
+from array import array
+from collections import defaultdict
+
+from config import INDEX_REBUILD_LAG
+from database import ChangeLogReader, db, read_transaction
+from utils import normalize_username, is_user_id
+
+logger = logging.getLogger(__name__)
+
+MAX_DISTANCE = 2
+# Короткие скелеты слишком легко "совпадают" с чем угодно
+MIN_LENGTH = 4
+SHORT_LENGTH = 8
+# Границы слова - отдельные символы: первые и последние буквы дают свои триграммы
+PAD_START, PAD_END = '\x02', '\x03'
+# Сколько номеров из списков триграмм просматривается за один поиск
+SCAN_LIMIT = 50000
+# Для скольких кандидатов считается расстояние
+MAX_CANDIDATES = 200
+
+HOMOGLYPHS = str.maketrans({
+    # Кириллица, похожая на латиницу
+    'а': 'a', 'в': 'b', 'е': 'e', 'ё': 'e', 'к': 'k', 'м': 'm', 'н': 'h',
+    'о': 'o', 'р': 'p', 'с': 'c', 'т': 't', 'у': 'y', 'х': 'x', 'ь': 'b',
+    'і': 'l', 'ј': 'j', 'ѕ': 's', 'ԁ': 'd', 'һ': 'h', 'ԛ': 'q', 'ԝ': 'w',
+    # Цифры вместо букв
+    '0': 'o', '1': 'l', '3': 'e', '4': 'a', '5': 's', '7': 't', '8': 'b',
+    # Путаемые между собой латинские
+    'i': 'l',
+})
+
+_REPEATS = re.compile(r'(.)\1+')
+
+
+def skeleton(username):
+    """Приводит юзернейм к виду, в котором двойники совпадают"""
+    return _REPEATS.sub(r'\1', normalize_username(username).translate(HOMOGLYPHS))
+
+
+def _grams(key):
+    """Множество триграмм скелета с границами слова"""
+    padded = PAD_START * 2 + key + PAD_END * 2
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _max_distance(length):
+    return 1 if length < SHORT_LENGTH else MAX_DISTANCE
+
+
+def distance(a, b, limit=MAX_DISTANCE):
+    """Расстояние Дамерау-Левенштейна (OSA); больше limit -> limit + 1"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev2 = None
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        row_min = i
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+            row_min = min(row_min, cur[j])
+        if row_min > limit:
+            return limit + 1
+        prev2, prev = prev, cur
+    return min(prev[-1], limit + 1)
+
+
+class _Data:
+    """Содержимое индекса. Строится целиком в потоке и подменяется одной ссылкой"""
+
+    __slots__ = ('user_ids', 'usernames', 'postings', 'live')
+
+    def __init__(self):
+        self.user_ids = array('Q')
+        self.usernames = []     # None - запись удалена (номер не переиспользуется)
+        self.postings = {}      # триграмма + chr(длина скелета) -> array('I') номеров
+        self.live = 0
+
+    def _lists(self, key):
+        suffix = chr(len(key))
+        return [self.postings.get(gram + suffix, ()) for gram in _grams(key)]
+
+    def find(self, user_id, username, key):
+        """Номер записи (user_id, username) или None - по самому короткому списку её триграмм"""
+        user_id = int(user_id)
+        for i in min(self._lists(key), key=len):
+            if self.usernames[i] == username and self.user_ids[i] == user_id:
+                return i
+        return None
+
+    def add(self, user_id, username, check=True):
+        """check=False - при полной загрузке, где пары (user_id, username) заведомо разные"""
+        key = skeleton(username)
+        # Индекс хранит только числовые ID, как и снапшот
+        if not key or not is_user_id(user_id):
+            return
+        if check and self.find(user_id, username, key) is not None:
+            return
+        i = len(self.usernames)
+        # Номер попадает в списки последним: поиск в потоке не увидит недописанную запись
+        self.user_ids.append(int(user_id))
+        self.usernames.append(username)
+        suffix = chr(len(key))
+        for gram in _grams(key):
+            posting = self.postings.get(gram + suffix)
+            if posting is None:
+                posting = self.postings[gram + suffix] = array('I')
+            posting.append(i)
+        self.live += 1
+
+    def remove(self, user_id, username):
+        key = skeleton(username)
+        if not key or not is_user_id(user_id):
+            return
+        i = self.find(user_id, username, key)
+        if i is not None:
+            self.usernames[i] = None
+            self.live -= 1
+
+
+class FuzzyIndex:
+    """Индекс похожих юзернеймов, синхронизируемый по журналу изменений"""
+
+    def __init__(self, database):
+        self.database = database
+        self.reader = None
+        self.data = _Data()
+        self.rebuilding = None
+
+    @property
+    def ready(self):
+        return self.reader is not None
+
+    def _build(self):
+        """Полная загрузка на своём соединении; возвращает (данные, читатель журнала)"""
+        started = time.perf_counter()
+        data = _Data()
+        with read_transaction(self.database.db_path) as reader:
+            # Курсор журнала и строки - из одной транзакции чтения
+            seq = reader.get_last_change_seq()
+            for user_id, username in reader.get_user_keys():
+                data.add(user_id, username, check=False)
+        logger.info(f"🔤 Индекс похожих юзернеймов: {data.live} имён, "
+                    f"{len(data.postings)} списков триграмм за {time.perf_counter() - started:.2f} с")
+        return data, ChangeLogReader(self.database, seq)
+
+    def load(self):
+        """Полная загрузка синхронно (скрипты, startup_profile.py)"""
+        self.data, self.reader = self._build()
+
+    async def warm(self):
+        """Строит (или перестраивает) индекс в потоке, не блокируя обработку апдейтов"""
+        try:
+            data, reader = await asyncio.to_thread(self._build)
+        except Exception as e:
+            logger.error(f"❌ Не удалось построить индекс похожих юзернеймов: {e}")
+            return
+        finally:
+            self.rebuilding = None
+        # Подмена на event loop: дельты журнала применяются тоже только здесь
+        self.data, self.reader = data, reader
+
+    def sync(self):
+        """Применяет новые изменения из журнала (на event loop)"""
+        if not self.ready or self.rebuilding is not None:
+            return
+        if self.database.get_last_change_seq() - self.reader.cursor > INDEX_REBUILD_LAG:
+            # Догонять по одному изменению дольше, чем построить заново
+            self.rebuilding = asyncio.create_task(self.warm())
+            return
+        while True:
+            changes = self.reader.poll()
+            for change in changes:
+                # Дозаполнения пишут 'update' без смены юзернейма - индексу менять нечего
+                if change.old_username == change.new_username:
+                    continue
+                if change.old_username:
+                    self.data.remove(change.user_id, change.old_username)
+                if change.new_username:
+                    self.data.add(change.user_id, change.new_username)
+            if not changes:
+                break
+
+    def search(self, query, limit=5):
+        """Похожие юзернеймы: [(расстояние, user_id, username)] по возрастанию расстояния.
+
+        Только память, без базы - можно вызывать из потока"""
+        data = self.data
+        if not self.ready:
+            # Индекс ещё строится (warm) - нечёткий поиск пока недоступен
+            return []
+        key = skeleton(query)
+        if len(key) < MIN_LENGTH:
+            return []
+        max_distance = _max_distance(len(key))
+        lengths = range(len(key) - max_distance, len(key) + max_distance + 1)
+
+        # Для каждой триграммы - списки всех подходящих длин; от редких к частым
+        grams = []
+        for gram in _grams(key):
+            lists = [data.postings[gram + chr(length)] for length in lengths
+                     if length > 0 and gram + chr(length) in data.postings]
+            grams.append((sum(map(len, lists)), lists))
+        grams.sort(key=lambda item: item[0])
+
+        counts = defaultdict(int)
+        scanned = skipped = 0
+        for size, lists in grams:
+            if scanned and scanned + size > SCAN_LIMIT:
+                skipped += 1
+                continue
+            scanned += size
+            for posting in lists:
+                for i in posting:
+                    counts[i] += 1
+        # Правка разрушает не больше 4 триграмм (перестановка соседних букв);
+        # непросмотренные триграммы могли совпасть - на них порог снижается
+        need = max(1, len(grams) - 4 * max_distance - skipped)
+        candidates = sorted((i for i, count in counts.items() if count >= need),
+                            key=lambda i: -counts[i])[:MAX_CANDIDATES]
+
+        matches = []
+        for i in candidates:
+            username = data.usernames[i]
+            if username is None:
+                continue
+            dist = distance(key, skeleton(username), max_distance)
+            if dist <= max_distance:
+                matches.append((dist, str(data.user_ids[i]), username))
+        matches.sort(key=lambda m: (m[0], abs(len(m[2]) - len(query)), m[2]))
+        return matches[:limit]
+
+    async def find_similar(self, query, limit=5):
+        """search для обработчиков: дельты журнала - здесь, поиск - в потоке"""
+        if not self.ready:
+            return []
+        self.sync()
+        return await asyncio.to_thread(self.search, query, limit)
+
+
+fuzzy_index = FuzzyIndex(db)
@@ -1,16 +1,33 @@
+import asyncio
+import html
 import json
+import logging
 from datetime import datetime
-from aiogram import Router, types
-from aiogram.types import Message, ReplyKeyboardRemove
-from aiogram.filters import Command
+from aiogram import Router, types, F
+from aiogram.types import (Message, InlineQuery, InlineQueryResultArticle,
+                           InputTextMessageContent, ChatMemberUpdated)
+from aiogram.dispatcher.event.handler import CallableObject
+from aiogram.filters import ChatMemberUpdatedFilter, JOIN_TRANSITION
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
-from config import BOT_TOKEN, ADMIN_IDS, THREAT_LEVELS, PROJECT_NAME
+from config import BOT_TOKEN, ADMIN_IDS, THREAT_LEVELS, PROJECT_NAME, INLINE_RESULTS_LIMIT, INLINE_CACHE_TIME
+import db_inspect
+import lookup
+import proofs
+import render
 from database import db
-from keyboards import get_main_keyboard, get_admin_keyboard, get_cancel_keyboard
+from fuzzy import fuzzy_index
+from join_checker import join_checker
+from prefix_index import prefix_index
+from metrics import metrics
+from logging_setup import log_context
+from utils import is_user_id
+from keyboards import get_main_keyboard, get_admin_keyboard, get_cancel_keyboard, REMOVE_KEYBOARD
 
 router = Router()
+# Проверки пишутся выборочно (LOG_LOOKUP_SAMPLE), найденные в базе - всегда
+lookup_logger = logging.getLogger('lookup')
 
 
 # Проверка админа
@@ -28,112 +45,94 @@ class AddScammer(StatesGroup):
 
 
 # ============ КОМАНДЫ ============
-@router.message(Command("start"))
 async def cmd_start(message: Message):
-    welcome_text = (
-        f"🛡️ <b>Добро пожаловать в бота с нашей антискам базой проекта TRUSTON!</b>\n\n"
-        f"Я помогаю проверять пользователей на наличие жалоб и предупреждений о мошенничестве.\n\n"
-        f"<b>Как использовать:</b>\n"
-        f"• Отправьте <b>ID</b> пользователя (только цифры)\n"
-        f"• Или отправьте <b>@username</b> (без @ или с ним)\n\n"
-        f"<i>База обновляется командой TRUSTON для безопасности сообщества</i>"
-    )
-
     if is_admin(message.from_user.id):
-        await message.answer(welcome_text, reply_markup=get_admin_keyboard(), parse_mode="HTML")
+        await message.answer(render.WELCOME_TEXT, reply_markup=get_admin_keyboard(), parse_mode="HTML")
     else:
-        await message.answer(welcome_text, reply_markup=get_main_keyboard(), parse_mode="HTML")
+        await message.answer(render.WELCOME_TEXT, reply_markup=get_main_keyboard(), parse_mode="HTML")
 
 
-@router.message(Command("help"))
 async def cmd_help(message: Message):
-    help_text = (
-        f"🛡️ <b>Справка по боту TRUSTON</b>\n\n"
-        f"<b>Основные команды:</b>\n"
-        f"• /start - Запустить бота\n"
-        f"• /check - Проверить пользователя\n"
-        f"• /add - Добавить запись (админы)\n"
-        f"• /stats - Статистика базы\n"
-        f"• /help - Эта справка\n\n"
-        f"<b>Уровни угрозы:</b>\n"
-        f"• 1️⃣ - Проверенный\n"
-        f"• 2️⃣ - Подозрительный\n"
-        f"• 3️⃣ - Мошенник\n\n"
-        f"<b>Просто отправьте ID или @username для проверки!</b>"
-    )
-    await message.answer(help_text, parse_mode="HTML")
+    await message.answer(render.HELP_TEXT, parse_mode="HTML")
 
 
-@router.message(Command("stats"))
 async def cmd_stats(message: Message):
-    all_records = db.get_all_scammers()
-    total = len(all_records)
-
-    stats_text = (
-        f"📊 <b>Статистика базы TRUSTON</b>\n\n"
-        f"• 📁 Всего записей: <b>{total}</b>\n"
-        f"• 📅 Последнее обновление: {datetime.now().strftime('%d.%m.%Y %H:%M')}\n\n"
-        f"<i>База работает и обновляется</i>"
-    )
+    await message.answer(render.stats(db.count_scammers()), parse_mode="HTML")
 
-    await message.answer(stats_text, parse_mode="HTML")
 
-
-@router.message(Command("check"))
-async def cmd_check(message: Message):
-    await message.answer("🔍 Отправьте ID или @username для проверки:", reply_markup=ReplyKeyboardRemove())
+async def cmd_metrics(message: Message):
+    if not is_admin(message.from_user.id):
+        return
+    await message.answer(f"<pre>{html.escape(metrics.render() or 'Метрик пока нет')}</pre>", parse_mode="HTML")
 
 
-# ============ ПОИСК ПОЛЬЗОВАТЕЛЯ ============
-@router.message()
-async def process_message(message: Message, state: FSMContext):
-    # Если пользователь в процессе добавления - пропускаем
-    current_state = await state.get_state()
-    if current_state:
+async def cmd_dbinspect(message: Message):
+    if not is_admin(message.from_user.id):
         return
+    await message.answer("⏳ Проверяю планы запросов и размеры таблиц...")
+    # Только запросы с полным просмотром - полный отчёт не влезет в сообщение
+    text = await asyncio.to_thread(db_inspect.report, db.db_path, 100, False)
+    for start in range(0, len(text), 3500):
+        await message.answer(f"<pre>{html.escape(text[start:start + 3500])}</pre>", parse_mode="HTML")
 
-    # Пропускаем команды
-    if message.text and message.text.startswith('/'):
-        return
 
-    # Пропускаем кнопки меню
-    if message.text in ["🔍 Проверить", "📊 Статистика", "❓ Справка", "➕ Добавить", "🗑️ Удалить", "📋 Все записи",
-                        "❌ Отмена"]:
-        return
+async def cmd_check(message: Message):
+    await message.answer("🔍 Отправьте ID или @username для проверки:", reply_markup=REMOVE_KEYBOARD)
 
+
+# ============ ПОИСК ПОЛЬЗОВАТЕЛЯ ============
+async def process_message(message: Message):
     user_input = message.text.strip()
     if not user_input:
         return
 
     # Ищем пользователя
-    user_data, found_by = db.find_user(user_input)
+    user_data, found_by = lookup.find_user(user_input)
 
     if not user_data:
-        response = f"🔍 <b>Поиск:</b> <code>{user_input}</code>\n\n❌ Не найден в базе.\n✅ Статус: чистый"
+        response = render.not_found(user_input)
+        # Точного совпадения нет - проверяем, не двойник ли это известного юзернейма
+        similar = [] if user_input.isdigit() else await fuzzy_index.find_similar(user_input)
+        lookup_logger.info("lookup", extra={'fields': {'query': user_input, 'found_by': None, 'similar': len(similar)}})
+        lines = []
+        for dist, similar_id, similar_username in similar:
+            similar_data, _ = lookup.find_user(similar_id)
+            # Похожесть на проверенного пользователя (уровень 1) - не повод для тревоги
+            if not similar_data or similar_data[2] < 2:
+                continue
+            level_info = THREAT_LEVELS.get(similar_data[2], THREAT_LEVELS[3])
+            lines.append(f"{len(lines) + 1}. {level_info['emoji']} @{html.escape(similar_username)} "
+                         f"(<code>{similar_id}</code>)")
+        if lines:
+            response = (
+                f"🔍 <b>Поиск:</b> <code>{html.escape(user_input)}</code>\n\n"
+                "❌ Точного совпадения в базе нет.\n"
+                "⚠️ <b>Юзернейм похож на известного мошенника:</b>\n"
+                + "\n".join(lines) +
+                "\n\n<i>Сверьте ID перед сделкой - мошенники регистрируют похожие юзернеймы</i>"
+            )
         keyboard = get_admin_keyboard() if is_admin(message.from_user.id) else get_main_keyboard()
         await message.answer(response, parse_mode="HTML", reply_markup=keyboard)
         return
 
+    lookup_logger.info("lookup", extra={'always': True, 'fields': {
+        'query': user_input, 'found_by': found_by, 'found_id': user_data[0], 'threat_level': user_data[2]}})
+
     # Форматируем результат
-    user_id, username, level, reason, proof, date = user_data
-    level_info = THREAT_LEVELS.get(level, THREAT_LEVELS[3])
-
-    response = (
-        f"{level_info['emoji']} <b>{level_info['name']}</b>\n\n"
-        f"👤 <b>ID:</b> <code>{user_id}</code>\n"
-        f"📛 <b>Юзернейм:</b> @{username or 'не указан'}\n"
-        f"📝 <b>Причина:</b> {reason or 'Не указана'}\n"
-        f"🔗 <b>Доказательства:</b> {proof or 'Не приложены'}\n"
-        f"📅 <b>Дата внесения:</b> {date or 'Неизвестно'}\n\n"
-        f"<i>База данных проекта TRUSTON</i>"
-    )
+    old_usernames = [alias for alias in lookup.get_aliases(user_data[0]) if alias != user_data[1]]
+    found_note = f"🔎 <i>Найден по прежнему юзернейму @{html.escape(user_input.replace('@', ''))}</i>\n\n" if found_by == 'alias' else ""
+    response = render.user_card(user_data, old_usernames, found_note)
 
     keyboard = get_admin_keyboard() if is_admin(message.from_user.id) else get_main_keyboard()
     await message.answer(response, parse_mode="HTML", reply_markup=keyboard)
 
+    # Доказательства - по сохранённым file_id, без повторной загрузки
+    files = db.get_proof_files(user_data[0])
+    if files:
+        await proofs.send_proofs(message.bot, message.chat.id, files)
+
 
 # ============ АДМИН КОМАНДЫ ============
-@router.message(Command("add"))
 async def cmd_add(message: Message, state: FSMContext):
     if not is_admin(message.from_user.id):
         await message.answer("⛔ Нет доступа", reply_markup=get_main_keyboard())
@@ -149,16 +148,10 @@ async def cmd_add(message: Message, state: FSMContext):
     )
 
 
-@router.message(AddScammer.waiting_for_user_id)
 async def process_user_id(message: Message, state: FSMContext):
-    if message.text == "❌ Отмена":
-        await state.clear()
-        await message.answer("❌ Добавление отменено", reply_markup=get_admin_keyboard())
-        return
-
     user_id = message.text.strip()
-    if not user_id.isdigit():
-        await message.answer("❌ ID должен содержать только цифры. Попробуйте еще раз:")
+    if not is_user_id(user_id):
+        await message.answer("❌ ID должен содержать только цифры (не больше 19). Попробуйте еще раз:")
         return
 
     await state.update_data(user_id=user_id)
@@ -166,7 +159,6 @@ async def process_user_id(message: Message, state: FSMContext):
     await message.answer("Введите юзернейм (без @) или 'пропустить':")
 
 
-@router.message(AddScammer.waiting_for_username)
 async def process_username(message: Message, state: FSMContext):
     username = message.text.strip().replace('@', '')
     if username.lower() in ['пропустить', 'нет', 'no', '-']:
@@ -177,19 +169,39 @@ async def process_username(message: Message, state: FSMContext):
     await message.answer("Введите причину внесения:")
 
 
-@router.message(AddScammer.waiting_for_reason)
 async def process_reason(message: Message, state: FSMContext):
     reason = message.text.strip()
     await state.update_data(reason=reason)
     await state.set_state(AddScammer.waiting_for_proof)
-    await message.answer("Введите доказательства или 'нет':")
+    await message.answer("Введите доказательства текстом, пришлите фото/документы или 'нет':")
 
 
-@router.message(AddScammer.waiting_for_proof)
 async def process_proof(message: Message, state: FSMContext):
+    data = await state.get_data()
+    file = proofs.extract_file(message)
+    if file is not None:
+        files = data.get('files', [])
+        if file[0] not in {attached[0] for attached in files}:
+            files.append(list(file))
+        update = {'files': files}
+        if message.caption and not data.get('proof'):
+            update['proof'] = message.caption.strip()
+        # На альбом (несколько файлов одним сообщением) отвечаем один раз
+        reply = message.media_group_id is None or message.media_group_id != data.get('media_group_id')
+        update['media_group_id'] = message.media_group_id
+        await state.update_data(**update)
+        if reply:
+            await message.answer("📎 Файл добавлен. Пришлите ещё фото/документы или текст доказательств "
+                                 "('нет' - без текста):")
+        return
+
+    if not message.text:
+        await message.answer("❌ Пришлите текст, фото или документ:")
+        return
+
     proof = message.text.strip()
     if proof.lower() in ['нет', 'no', 'н']:
-        proof = "Не предоставлены"
+        proof = data.get('proof') or ("Файлы приложены" if data.get('files') else "Не предоставлены")
 
     await state.update_data(proof=proof)
     await state.set_state(AddScammer.waiting_for_threat_level)
@@ -203,7 +215,6 @@ async def process_proof(message: Message, state: FSMContext):
     )
 
 
-@router.message(AddScammer.waiting_for_threat_level)
 async def process_threat_level(message: Message, state: FSMContext):
     try:
         threat_level = int(message.text.strip())
@@ -217,14 +228,16 @@ async def process_threat_level(message: Message, state: FSMContext):
     # Получаем все данные
     user_data = await state.get_data()
 
-    # Добавляем в базу
+    # Запись и файлы доказательств - одной транзакцией
+    files = user_data.get('files', [])
     success = db.add_scammer(
         user_id=user_data['user_id'],
         username=user_data.get('username', ''),
         threat_level=threat_level,
         reason=user_data['reason'],
         proof=user_data['proof'],
-        added_by=message.from_user.id
+        added_by=message.from_user.id,
+        files=[tuple(file) for file in files]
     )
 
     if success:
@@ -234,6 +247,7 @@ async def process_threat_level(message: Message, state: FSMContext):
             f"👤 ID: <code>{user_data['user_id']}</code>\n"
             f"📛 Юзернейм: @{user_data.get('username', 'не указан')}\n"
             f"🚨 Уровень: {level_info['name']}\n"
+            f"📎 Файлов: {len(files)}\n"
             f"📅 Дата: {datetime.now().strftime('%d.%m.%Y %H:%M')}",
             parse_mode="HTML",
             reply_markup=get_admin_keyboard()
@@ -245,27 +259,22 @@ async def process_threat_level(message: Message, state: FSMContext):
 
 
 # ============ КНОПКИ МЕНЮ ============
-@router.message(lambda m: m.text == "🔍 Проверить")
 async def button_check(message: Message):
     await cmd_check(message)
 
 
-@router.message(lambda m: m.text == "📊 Статистика")
 async def button_stats(message: Message):
     await cmd_stats(message)
 
 
-@router.message(lambda m: m.text == "❓ Справка")
 async def button_help(message: Message):
     await cmd_help(message)
 
 
-@router.message(lambda m: m.text == "➕ Добавить")
 async def button_add(message: Message, state: FSMContext):
     await cmd_add(message, state)
 
 
-@router.message(lambda m: m.text == "📋 Все записи")
 async def button_list(message: Message):
     if not is_admin(message.from_user.id):
         await message.answer("⛔ Нет доступа", reply_markup=get_main_keyboard())
@@ -288,8 +297,171 @@ async def button_list(message: Message):
     await message.answer(text, parse_mode="HTML")
 
 
-@router.message(lambda m: m.text == "❌ Отмена")
 async def button_cancel(message: Message, state: FSMContext):
     await state.clear()
     keyboard = get_admin_keyboard() if is_admin(message.from_user.id) else get_main_keyboard()
-    await message.answer("❌ Действие отменено", reply_markup=keyboard)
\ No newline at end of file
+    await message.answer("❌ Действие отменено", reply_markup=keyboard)
+
+# ============ НОВЫЕ УЧАСТНИКИ ГРУПП ============
+@router.chat_member(ChatMemberUpdatedFilter(member_status_changed=JOIN_TRANSITION))
+async def on_user_joined(event: ChatMemberUpdated):
+    join_checker.submit(event.bot, event.chat.id, event.new_chat_member.user)
+
+
+@router.message(F.new_chat_members)
+async def on_new_chat_members(message: Message):
+    # Сервисное сообщение приходит и без прав администратора;
+    # дубли с chat_member схлопываются внутри окна проверки
+    for user in message.new_chat_members:
+        join_checker.submit(message.bot, message.chat.id, user)
+
+
+# ============ МАРШРУТИЗАЦИЯ СООБЩЕНИЙ ============
+# Вместо цепочки фильтров (каждый проверяется по очереди на каждом сообщении)
+# один обработчик и готовые таблицы: команда, состояние и кнопка ищутся в
+# словаре, так что цена апдейта не растёт с числом кнопок и команд.
+# Порядок: отмена (работает в любом состоянии) -> команды -> шаг диалога ->
+# кнопки меню -> поиск (только в личке)
+COMMANDS = {
+    'start': cmd_start,
+    'help': cmd_help,
+    'stats': cmd_stats,
+    'check': cmd_check,
+    'add': cmd_add,
+    'cancel': button_cancel,
+    'metrics': cmd_metrics,
+    'dbinspect': cmd_dbinspect,
+}
+
+BUTTONS = {
+    "🔍 Проверить": button_check,
+    "📊 Статистика": button_stats,
+    "❓ Справка": button_help,
+    "➕ Добавить": button_add,
+    "📋 Все записи": button_list,
+}
+CANCEL_TEXT = "❌ Отмена"
+
+STATES = {
+    AddScammer.waiting_for_user_id.state: process_user_id,
+    AddScammer.waiting_for_username.state: process_username,
+    AddScammer.waiting_for_reason.state: process_reason,
+    AddScammer.waiting_for_proof.state: process_proof,
+    AddScammer.waiting_for_threat_level.state: process_threat_level,
+}
+# Шаги, которые принимают не только текст (фото, документы)
+MEDIA_STATES = {AddScammer.waiting_for_proof.state}
+
+# Сигнатуры разбираются один раз: обработчик получает state, только если его принимает
+_COMMANDS = {name: CallableObject(handler) for name, handler in COMMANDS.items()}
+_BUTTONS = {text: CallableObject(handler) for text, handler in BUTTONS.items()}
+_STATES = {name: CallableObject(handler) for name, handler in STATES.items()}
+_CANCEL = CallableObject(button_cancel)
+_LOOKUP = CallableObject(process_message)
+
+
+def _parse_command(text):
+    """('start', 'truston_bot') из '/start@truston_bot payload' или (None, None)"""
+    if not text or not text.startswith('/'):
+        return None, None
+    parts = text[1:].split(maxsplit=1)
+    if not parts:
+        return None, None
+    name, _, mention = parts[0].partition('@')
+    return name, mention or None
+
+
+async def _call(handler, message, state):
+    context = log_context.get()
+    if context is not None:
+        context['handler'] = handler.callback.__name__
+    return await handler.call(message, state=state)
+
+
+async def route_message(message: Message, state: FSMContext):
+    # Запоминаем текущий юзернейм автора любого сообщения, если он есть в базе
+    if message.from_user:
+        db.observe_username(message.from_user.id, message.from_user.username)
+
+    text = message.text
+    if text == CANCEL_TEXT:
+        return await _call(_CANCEL, message, state)
+
+    name, mention = _parse_command(text or message.caption)
+    if name is not None:
+        # /start@другой_бот в группе - не нам
+        if mention and mention.lower() != (await message.bot.me()).username.lower():
+            return
+        handler = _COMMANDS.get(name)
+        if handler is not None:
+            return await _call(handler, message, state)
+
+    current_state = await state.get_state()
+    if current_state is not None:
+        handler = _STATES.get(current_state)
+        if handler is None:
+            # Состояние от старой версии бота - сбрасываем, чтобы диалог не застрял
+            await state.clear()
+        elif text or current_state in MEDIA_STATES:
+            return await _call(handler, message, state)
+        else:
+            await message.answer("❌ Пришлите ответ текстом или ❌ Отмена")
+            return
+
+    if text is None:
+        return
+    handler = _BUTTONS.get(text)
+    if handler is not None:
+        return await _call(handler, message, state)
+
+    # Поиск - всё остальное в личке; в группах на обычный текст не отвечаем
+    if message.chat.type == "private" and not text.startswith('/'):
+        return await _call(_LOOKUP, message, state)
+
+
+router.message.register(route_message)
+
+
+# ============ INLINE-РЕЖИМ ============
+@router.inline_query()
+async def inline_lookup(inline_query: InlineQuery):
+    query = inline_query.query.strip()
+    if not query:
+        await inline_query.answer([], cache_time=INLINE_CACHE_TIME)
+        return
+
+    # Индекс в памяти отвечает на каждое нажатие без скана базы,
+    # карточки дочитываются одним запросом по уникальному индексу
+    if prefix_index.ready:
+        user_ids = prefix_index.search(query, limit=INLINE_RESULTS_LIMIT)
+    else:
+        # Индекс ещё строится при старте - пока только точное совпадение
+        user_data, _ = lookup.find_user(query)
+        user_ids = [user_data[0]] if user_data else []
+    results = []
+    for user_data in db.get_scammers(user_ids):
+        user_id, username, level = user_data[0], user_data[1], user_data[2]
+        level_info = THREAT_LEVELS.get(level, THREAT_LEVELS[3])
+        results.append(InlineQueryResultArticle(
+            id=user_id,
+            title=f"{level_info['emoji']} {level_info['name']}",
+            description=f"ID {user_id} · @{username or 'не указан'}",
+            input_message_content=InputTextMessageContent(
+                message_text=render.user_card(user_data),
+                parse_mode="HTML"
+            )
+        ))
+
+    lookup_logger.info("inline", extra={'fields': {'query': query, 'results': len(results)}})
+    if not results:
+        results.append(InlineQueryResultArticle(
+            id="not_found",
+            title="✅ Не найден в базе",
+            description=f"{query} - нареканий нет",
+            input_message_content=InputTextMessageContent(
+                message_text=render.not_found(query),
+                parse_mode="HTML"
+            )
+        ))
+
+    await inline_query.answer(results, cache_time=INLINE_CACHE_TIME, is_personal=False)
@@ -0,0 +1,172 @@
+"""
+HTTP-сессия Bot API: пул соединений, keep-alive, кэш DNS, таймауты по методам
+
+Все запросы бота (message.answer, send_media_group, getUpdates...) идут
+через одну сессию aiohttp. Здесь она настраивается из config: размер пула,
+сколько держать простаивающее соединение, сколько помнить DNS, таймаут
+для каждого метода и адрес своего Bot API сервера (BOT_API_URL).
+
+Задержка каждого метода и работа пула (новые соединения против
+переиспользованных, обращения к DNS) пишутся в metrics через TraceConfig
+aiohttp.
+
+Проверка на локальной заглушке вместо api.telegram.org:
+python http_session.py [--requests 200]
+"""
+
+import argparse
+import asyncio
+import time
+
+from aiohttp import ClientSession, TraceConfig
+from aiohttp.hdrs import USER_AGENT
+from aiohttp.http import SERVER_SOFTWARE
+from aiogram import __version__
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+from config import (HTTP_POOL_SIZE, HTTP_KEEPALIVE, HTTP_DNS_TTL, HTTP_TIMEOUT, HTTP_METHOD_TIMEOUTS,
+                    BOT_API_URL, BOT_API_LOCAL)
+from metrics import metrics
+
+
+def _trace_config():
+    """Счётчики пула и DNS; длительности - в мс"""
+    trace = TraceConfig()
+
+    async def on_connection_create_start(session, ctx, params):
+        ctx.connect_started = time.perf_counter()
+
+    async def on_connection_create_end(session, ctx, params):
+        metrics.inc('http.connections_created')
+        metrics.observe('http.connect', (time.perf_counter() - ctx.connect_started) * 1000)
+
+    async def on_connection_reuseconn(session, ctx, params):
+        metrics.inc('http.connections_reused')
+
+    async def on_connection_queued_start(session, ctx, params):
+        # Пул занят целиком - запрос ждёт свободное соединение
+        metrics.inc('http.pool_waits')
+
+    async def on_dns_resolvehost_start(session, ctx, params):
+        ctx.dns_started = time.perf_counter()
+
+    async def on_dns_resolvehost_end(session, ctx, params):
+        metrics.inc('http.dns_lookups')
+        metrics.observe('http.dns', (time.perf_counter() - ctx.dns_started) * 1000)
+
+    async def on_dns_cache_hit(session, ctx, params):
+        metrics.inc('http.dns_cache_hits')
+
+    trace.on_connection_create_start.append(on_connection_create_start)
+    trace.on_connection_create_end.append(on_connection_create_end)
+    trace.on_connection_reuseconn.append(on_connection_reuseconn)
+    trace.on_connection_queued_start.append(on_connection_queued_start)
+    trace.on_dns_resolvehost_start.append(on_dns_resolvehost_start)
+    trace.on_dns_resolvehost_end.append(on_dns_resolvehost_end)
+    trace.on_dns_cache_hit.append(on_dns_cache_hit)
+    return trace
+
+
+class InstrumentedSession(AiohttpSession):
+    """AiohttpSession с настраиваемым пулом и метриками по методам Bot API"""
+
+    def __init__(self, pool_size=HTTP_POOL_SIZE, keepalive=HTTP_KEEPALIVE, dns_ttl=HTTP_DNS_TTL,
+                 method_timeouts=None, api_url=None, local=False, **kwargs):
+        if api_url:
+            kwargs['api'] = TelegramAPIServer.from_base(api_url, is_local=local)
+        super().__init__(limit=pool_size, **kwargs)
+        self._connector_init.update(
+            keepalive_timeout=keepalive,
+            use_dns_cache=True,
+            ttl_dns_cache=dns_ttl,
+        )
+        self.method_timeouts = method_timeouts or {}
+
+    async def create_session(self):
+        # Как в AiohttpSession, плюс trace_configs
+        if self._should_reset_connector:
+            await self.close()
+
+        if self._session is None or self._session.closed:
+            self._session = ClientSession(
+                connector=self._connector_type(**self._connector_init),
+                headers={USER_AGENT: f"{SERVER_SOFTWARE} aiogram/{__version__}"},
+                trace_configs=[_trace_config()],
+            )
+            self._should_reset_connector = False
+
+        return self._session
+
+    async def make_request(self, bot, method, timeout=None):
+        name = method.__api_method__
+        if timeout is None:
+            # getUpdates сюда не попадает: polling передаёт свой таймаут
+            timeout = self.method_timeouts.get(name)
+        started = time.perf_counter()
+        try:
+            return await super().make_request(bot, method, timeout)
+        except Exception:
+            metrics.inc(f'http.{name}.errors')
+            raise
+        finally:
+            metrics.inc('http.requests')
+            metrics.observe(f'http.{name}', (time.perf_counter() - started) * 1000)
+
+
+def create_session():
+    """Сессия бота по настройкам из config"""
+    return InstrumentedSession(
+        method_timeouts=HTTP_METHOD_TIMEOUTS,
+        api_url=BOT_API_URL,
+        local=BOT_API_LOCAL,
+        timeout=HTTP_TIMEOUT,
+    )
+
+
+# ============ ПРОВЕРКА НА ЗАГЛУШКЕ ============
+async def _stand_in(host='127.0.0.1', port=0):
+    """Локальный сервер, который отвечает как Bot API на getMe и sendMessage"""
+    from aiohttp import web
+
+    async def handle(request):
+        method = request.match_info['method']
+        if method == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'stand-in', 'username': 'stand_in_bot'}
+        else:
+            result = {'message_id': 1, 'date': int(time.time()), 'chat': {'id': 1, 'type': 'private'},
+                      'text': 'ok'}
+        return web.json_response({'ok': True, 'result': result})
+
+    app = web.Application()
+    app.router.add_post('/bot{token}/{method}', handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    return runner, f"http://{host}:{port}"
+
+
+async def self_check(requests):
+    from aiogram import Bot
+
+    runner, url = await _stand_in()
+    bot = Bot(token="42:stand-in", session=InstrumentedSession(api_url=url, method_timeouts=HTTP_METHOD_TIMEOUTS))
+    try:
+        await bot.get_me()
+        # Параллельно, как ответы нескольким пользователям сразу
+        await asyncio.gather(*(bot.send_message(1, "ping") for _ in range(requests)))
+    finally:
+        await bot.session.close()
+        await runner.cleanup()
+    print(f"Заглушка {url}, запросов: {requests + 1}")
+    for name, value in sorted(metrics.snapshot().items()):
+        if name.startswith('http.'):
+            print(f"{name}: {value}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Проверка HTTP-сессии бота на локальной заглушке")
+    parser.add_argument("--requests", type=int, default=200)
+    asyncio.run(self_check(parser.parse_args().requests))
@@ -0,0 +1,127 @@
+"""
+Проверка новых участников групп
+
+Входы копятся в коротком окне (JOIN_BATCH_WINDOW) и проверяются одним
+запросом к базе на всех сразу - рейд из сотен входов в секунду даёт
+несколько запросов, а не сотни. Предупреждения в один чат отправляются
+не чаще раза в JOIN_WARNING_INTERVAL секунд: всё, что накопилось за это
+время, уходит одним сообщением.
+"""
+
+import asyncio
+import html
+import logging
+import time
+
+from config import THREAT_LEVELS, JOIN_BATCH_WINDOW, JOIN_WARNING_INTERVAL, JOIN_WARN_LEVELS
+from database import db
+
+logger = logging.getLogger(__name__)
+
+
+class JoinChecker:
+    def __init__(self, database):
+        self.database = database
+        self.pending = {}        # chat_id -> {user_id: user}
+        self.flagged = {}        # chat_id -> {user_id: (user, запись)} ждут отправки
+        self.last_warning = {}   # chat_id -> время последнего предупреждения
+        self.senders = {}        # chat_id -> отложенная отправка
+        self.flush_task = None
+        self.bot = None
+        self.closed = False
+        self.wake = asyncio.Event()  # будит отложенные отправки при остановке
+
+    def submit(self, bot, chat_id, user):
+        """Ставит вошедшего пользователя в очередь на проверку"""
+        if user.is_bot:
+            return
+        self.bot = bot
+        self.pending.setdefault(chat_id, {})[str(user.id)] = user
+        if self.flush_task is None:
+            self.flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(JOIN_BATCH_WINDOW)
+        self.flush_task = None
+        await self.flush()
+
+    async def flush(self):
+        """Проверяет всех накопившихся одним запросом"""
+        pending, self.pending = self.pending, {}
+        if not pending:
+            return
+
+        user_ids = list({user_id for users in pending.values() for user_id in users})
+        records = {row[0]: row for row in self.database.get_scammers(user_ids)}
+        logger.info(f"👥 Проверено входов: {len(user_ids)}, в базе: {len(records)}")
+
+        for chat_id, users in pending.items():
+            for user_id, user in users.items():
+                record = records.get(user_id)
+                if record is None:
+                    continue
+                self.database.observe_username(user_id, user.username)
+                if record[2] in JOIN_WARN_LEVELS:
+                    self.flagged.setdefault(chat_id, {})[user_id] = (user, record)
+            if chat_id in self.flagged:
+                self._schedule_warning(chat_id)
+
+    def _schedule_warning(self, chat_id):
+        if chat_id in self.senders or self.closed:
+            return
+        wait = self.last_warning.get(chat_id, 0) + JOIN_WARNING_INTERVAL - time.monotonic()
+        self.senders[chat_id] = asyncio.create_task(self._send_warning(chat_id, max(wait, 0)))
+
+    async def _send_warning(self, chat_id, delay):
+        try:
+            if delay:
+                try:
+                    await asyncio.wait_for(self.wake.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+            flagged = self.flagged.pop(chat_id, {})
+            if not flagged:
+                return
+            self.last_warning[chat_id] = time.monotonic()
+            await self.bot.send_message(chat_id, format_join_warning(flagged.values()), parse_mode="HTML")
+        except Exception as e:
+            logger.error(f"❌ Не удалось предупредить чат {chat_id}: {e}")
+        finally:
+            self.senders.pop(chat_id, None)
+            # Пока отправляли, могли отметить ещё кого-то
+            if chat_id in self.flagged:
+                self._schedule_warning(chat_id)
+
+    async def close(self):
+        """При остановке: проверяет накопившихся и шлёт отложенные предупреждения сразу"""
+        self.closed = True
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+            self.flush_task = None
+        await self.flush()
+        self.wake.set()
+        await asyncio.gather(*self.senders.values(), return_exceptions=True)
+        for chat_id in list(self.flagged):
+            await self._send_warning(chat_id, 0)
+
+
+def format_join_warning(flagged):
+    """Одно предупреждение на всех отмеченных участников"""
+    lines = []
+    for user, record in flagged:
+        user_id, username, level, reason = record[0], record[1], record[2], record[3]
+        level_info = THREAT_LEVELS.get(level, THREAT_LEVELS[3])
+        name = html.escape(user.full_name or username or user_id)
+        lines.append(
+            f"{level_info['emoji']} <a href=\"tg://user?id={user_id}\">{name}</a> "
+            f"(<code>{user_id}</code>) - {level_info['name']}\n"
+            f"   📝 {html.escape(reason or 'Причина не указана')}"
+        )
+    return (
+        "🛡️ <b>Внимание! В чат вошли пользователи из базы TRUSTON:</b>\n\n"
+        + "\n".join(lines) +
+        "\n\n<i>Не проводите сделки без гаранта</i>"
+    )
+
+
+join_checker = JoinChecker(db)
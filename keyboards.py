@@ -1,20 +1,36 @@
-from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
+from aiogram.types import ReplyKeyboardMarkup, ReplyKeyboardRemove, KeyboardButton
+from pydantic import ConfigDict
+
+
+class FrozenReplyKeyboard(ReplyKeyboardMarkup):
+    """Клавиатура, которую нельзя изменить: один экземпляр на все ответы"""
+    model_config = ConfigDict(frozen=True)
+
+
+# Собираются один раз при импорте, get_*_keyboard() отдают готовый объект
+MAIN_KEYBOARD = FrozenReplyKeyboard(keyboard=[
+    [KeyboardButton(text="🔍 Проверить")],
+    [KeyboardButton(text="📊 Статистика"), KeyboardButton(text="❓ Справка")]
+], resize_keyboard=True)
+
+ADMIN_KEYBOARD = FrozenReplyKeyboard(keyboard=[
+    [KeyboardButton(text="🔍 Проверить")],
+    [KeyboardButton(text="➕ Добавить"), KeyboardButton(text="📋 Все записи")],
+    [KeyboardButton(text="📊 Статистика"), KeyboardButton(text="❓ Справка")]
+], resize_keyboard=True)
+
+CANCEL_KEYBOARD = FrozenReplyKeyboard(keyboard=[[KeyboardButton(text="❌ Отмена")]], resize_keyboard=True)
+
+REMOVE_KEYBOARD = ReplyKeyboardRemove()
+
 
 def get_main_keyboard():
-    keyboard = [
-        [KeyboardButton(text="🔍 Проверить")],
-        [KeyboardButton(text="📊 Статистика"), KeyboardButton(text="❓ Справка")]
-    ]
-    return ReplyKeyboardMarkup(keyboard=keyboard, resize_keyboard=True)
+    return MAIN_KEYBOARD
+
 
 def get_admin_keyboard():
-    keyboard = [
-        [KeyboardButton(text="🔍 Проверить")],
-        [KeyboardButton(text="➕ Добавить"), KeyboardButton(text="📋 Все записи")],
-        [KeyboardButton(text="📊 Статистика"), KeyboardButton(text="❓ Справка")]
-    ]
-    return ReplyKeyboardMarkup(keyboard=keyboard, resize_keyboard=True)
+    return ADMIN_KEYBOARD
+
 
 def get_cancel_keyboard():
-    keyboard = [[KeyboardButton(text="❌ Отмена")]]
-    return ReplyKeyboardMarkup(keyboard=keyboard, resize_keyboard=True)
\ No newline at end of file
+    return CANCEL_KEYBOARD
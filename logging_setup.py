@@ -0,0 +1,169 @@
+"""
+Логирование без блокировок event loop
+
+Все модули пишут через обычный logging.getLogger(__name__), но у корневого
+логгера один обработчик - QueueHandler: запись в лог это только put в
+очередь, а файл и консоль обслуживает отдельный поток QueueListener.
+
+Формат JSON (BOT_LOG_FORMAT=text - обычный текст): время, уровень, логгер,
+сообщение, контекст апдейта (update_id, user_id, chat_id, handler - их
+выставляет update_logging.py) и поля из extra={'fields': {...}}.
+Файл ротируется и по размеру, и раз в сутки. Частые логи проверок
+(логгер lookup) пишутся выборочно - см. LOG_LOOKUP_SAMPLE.
+"""
+
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+
+from config import (LOG_DIR, LOG_LEVEL, LOG_FORMAT, LOG_CONSOLE, LOG_MAX_BYTES, LOG_BACKUP_COUNT,
+                    LOG_LOOKUP_SAMPLE)
+
+# Контекст текущего апдейта: {'update_id': ..., 'user_id': ..., 'chat_id': ..., 'handler': ...}
+log_context = ContextVar('log_context', default=None)
+
+TEXT_FORMAT = '%(asctime)s %(levelname)s [%(process_name)s] %(name)s: %(message)s'
+
+
+class ContextFilter(logging.Filter):
+    """Копирует контекст апдейта в запись (в потоке, который логирует)"""
+
+    def __init__(self, process_name):
+        super().__init__()
+        self.process_name = process_name
+
+    def filter(self, record):
+        record.process_name = self.process_name
+        record.context = log_context.get()
+        return True
+
+
+class SampleFilter(logging.Filter):
+    """Пропускает долю rate записей уровня INFO и ниже; extra={'always': True} - всегда"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno > logging.INFO or getattr(record, 'always', False):
+            return True
+        return random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'process': getattr(record, 'process_name', None),
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        context = getattr(record, 'context', None)
+        if context:
+            entry.update(context)
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class ExcQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler, который не вклеивает traceback в текст сообщения.
+
+    Стандартный prepare() форматирует запись целиком в msg и обнуляет
+    exc_info и exc_text - JsonFormatter тогда не видит исключения. Здесь
+    в msg попадает только сообщение, а traceback уходит в exc_text (его
+    выводят и JsonFormatter, и обычный Formatter)"""
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+            # Кадры traceback не держим в очереди
+            record.exc_info = None
+        return record
+
+
+class SizeAndTimeRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """Ротация при превышении max_bytes и в полночь; архивы file.1 ... file.N"""
+
+    def __init__(self, filename, max_bytes, backup_count):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+        self.rollover_at = self._next_midnight()
+
+    @staticmethod
+    def _next_midnight():
+        tomorrow = datetime.now().date() + timedelta(days=1)
+        return time.mktime(tomorrow.timetuple())
+
+    def shouldRollover(self, record):
+        if time.time() >= self.rollover_at:
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        self.rollover_at = self._next_midnight()
+
+
+def _formatter():
+    if LOG_FORMAT == 'text':
+        return logging.Formatter(TEXT_FORMAT)
+    return JsonFormatter()
+
+
+def file_handler(name):
+    """Ротируемый файл logs/<name>.log"""
+    os.makedirs(LOG_DIR, exist_ok=True)
+    handler = SizeAndTimeRotatingFileHandler(os.path.join(LOG_DIR, f"{name}.log"), LOG_MAX_BYTES, LOG_BACKUP_COUNT)
+    handler.setFormatter(_formatter())
+    return handler
+
+
+def setup_logging(process_name="bot", console=LOG_CONSOLE):
+    """Настраивает корневой логгер процесса. У каждого процесса свой файл:
+    ротировать один файл из нескольких процессов нельзя"""
+    handlers = [file_handler(process_name)]
+    if console:
+        stream = logging.StreamHandler(sys.stderr)
+        stream.setFormatter(_formatter())
+        handlers.append(stream)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = ExcQueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter(process_name))
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+    root.addHandler(queue_handler)
+    root.setLevel(LOG_LEVEL)
+    logging.getLogger('lookup').addFilter(SampleFilter(LOG_LOOKUP_SAMPLE))
+    # Об обработке каждого апдейта пишет update_logging
+    logging.getLogger('aiogram.event').setLevel(logging.WARNING)
+
+    listener.start()
+    # Дописать очередь до выхода из процесса
+    atexit.register(listener.stop)
+    return listener
@@ -0,0 +1,49 @@
+"""
+Чтение записей для ответов: из снапшота, иначе из базы
+
+Воркер кластера вызывает use_snapshot() при старте и дальше отвечает на
+проверки по отображённому в память файлу, не трогая SQLite. Основной
+процесс тоже открывает снапшот при старте, но берёт его только пока тот
+не отстал от журнала изменений - иначе идёт в базу.
+"""
+
+import snapshot
+from database import db
+
+reader = None
+# База, с журналом которой сверяется версия снапшота (None у воркеров)
+source = None
+
+
+def use_snapshot(path, database=None):
+    """Открывает снапшот; с database - сверяет его версию с журналом.
+    Проверку и пересборку файла ведёт snapshot.publish_snapshots"""
+    global reader, source
+    reader = snapshot.SnapshotReader(path)
+    source = database
+
+
+def _current():
+    if reader is None:
+        return None
+    current = reader.current()
+    if current is None or (source is not None and current.version < source.get_last_change_seq()):
+        return None
+    return current
+
+
+def find_user(query):
+    current = _current()
+    if current is not None:
+        user_data, match = snapshot.find_user(current, query)
+        # Поиска по подстроке в снапшоте нет - основной процесс доищет в базе
+        if user_data is not None or source is None:
+            return user_data, match
+    return db.find_user(query)
+
+
+def get_aliases(user_id):
+    current = _current()
+    if current is not None:
+        return snapshot.get_aliases(current, user_id)
+    return db.get_aliases(user_id)
@@ -1,23 +1,48 @@
+import argparse
 import asyncio
 import logging
 from aiogram import Bot, Dispatcher
-from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton
-from aiogram.filters import Command
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
-from datetime import datetime
 import os
 
-logging.basicConfig(level=logging.INFO)
+from config import (BOT_TOKEN, GOOGLE_SHEET_ID, FSM_DB_PATH, FSM_FLUSH_INTERVAL, FSM_STATE_TTL, FSM_CACHE_TTL,
+                    WORKERS, SNAPSHOT_PATH, SNAPSHOT_PUBLISH_INTERVAL, SHUTDOWN_TIMEOUT, METRICS_LOG_INTERVAL,
+                    IMPORT_BATCH_SIZE)
+from database import Database, db
+from fsm_storage import SQLiteStorage
+from fuzzy import fuzzy_index
+from handlers import router
+from http_session import create_session
+from join_checker import join_checker
+from logging_setup import setup_logging
+import lookup
+from maintenance import MaintenanceScheduler
+from metrics import log_metrics
+from prefix_index import prefix_index
+from shutdown import GracefulShutdown
+from snapshot import publish_snapshots
+import update_logging
+
 logger = logging.getLogger(__name__)
 
-# Инициализация бота
-bot = Bot(token="8473743571:AAHU6sSYsiUx8rFTxpXeR6oVhAONnZ3HT60")
-dp = Dispatcher()
 
-# Настройки
-ADMIN_ID = 599952947
-GOOGLE_SHEET_ID = "ТВОЙ_ID_ТАБЛИЦЫ"  # ЗАМЕНИ
+# Инициализация бота. Бот и диспетчер создаются функциями, а не при импорте:
+# воркеры кластера импортируют этот модуль и собирают свои
+def create_bot():
+    # Своя сессия: пул и таймауты из config, метрики запросов к Bot API
+    return Bot(token=BOT_TOKEN, session=create_session())
+
+
+def create_dispatcher(shared=False):
+    # Состояния диалогов переживают перезапуск: SQLite + кэш в памяти.
+    # shared - файл делят координатор и воркеры, кэшу верим только FSM_CACHE_TTL
+    storage = SQLiteStorage(FSM_DB_PATH, flush_interval=FSM_FLUSH_INTERVAL, state_ttl=FSM_STATE_TTL,
+                            cache_ttl=FSM_CACHE_TTL if shared else None)
+    dp = Dispatcher(storage=storage)
+    # Все обработчики (поиск, админка, inline-режим) живут в handlers.router
+    dp.include_router(router)
+    # Контекст апдейта (update_id, пользователь, обработчик, длительность) в логах
+    update_logging.install(dp)
+    return dp
 
 
 # Подключение к Google Sheets
@@ -26,13 +51,18 @@ def get_google_sheet():
     scope = ['https://spreadsheets.google.com/feeds',
              'https://www.googleapis.com/auth/drive']
 
-    # Если файла credentials.json нет, используем публичный доступ
+    # Без ключа к таблице не подключиться - и тяжёлые библиотеки не грузим
+    if not os.path.exists('credentials.json'):
+        return None
+    import gspread
+    from oauth2client.service_account import ServiceAccountCredentials
+
     try:
         creds = ServiceAccountCredentials.from_json_keyfile_name('credentials.json', scope)
         client = gspread.authorize(creds)
     except:
         # Публичный доступ только для чтения
-        client = gspread.service_account(filename='credentials.json') if os.path.exists('credentials.json') else None
+        client = gspread.service_account(filename='credentials.json')
 
     if client:
         try:
@@ -43,216 +73,107 @@ def get_google_sheet():
     return None
 
 
-# Клавиатуры
-def get_main_keyboard():
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="🔍 Проверить")],
-            [KeyboardButton(text="📊 Статистика"), KeyboardButton(text="❓ Справка")]
-        ],
-        resize_keyboard=True
-    )
-
-
-def get_admin_keyboard():
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="🔍 Проверить")],
-            [KeyboardButton(text="➕ Добавить"), KeyboardButton(text="📋 Все записи")],
-            [KeyboardButton(text="📊 Статистика"), KeyboardButton(text="❓ Справка")]
-        ],
-        resize_keyboard=True
-    )
-
-
-# Команды
-@dp.message(Command("start"))
-async def start(message: Message):
-    welcome = (
-        f"🛡️ <b>Добро пожаловать в бота антискам базы TRUSTON!</b>\n\n"
-        f"Просто отправьте ID или @username для проверки.\n\n"
-        f"✅ База обновляется ежедневно\n"
-        f"🔒 Данные хранятся в защищенном хранилище\n"
-        f"📊 Более 1000 проверенных записей"
-    )
-
-    if message.from_user.id == ADMIN_ID:
-        await message.answer(welcome, parse_mode="HTML", reply_markup=get_admin_keyboard())
-    else:
-        await message.answer(welcome, parse_mode="HTML", reply_markup=get_main_keyboard())
-
-
-@dp.message(Command("stats"))
-async def stats(message: Message):
-    sheet = get_google_sheet()
-    if sheet:
-        records = sheet.get_all_records()
-        count = len(records)
-
-        response = (
-            f"📊 <b>Статистика базы TRUSTON</b>\n\n"
-            f"• 📁 Всего записей: <b>{count}</b>\n"
-            f"• 📅 Обновлено: {datetime.now().strftime('%d.%m.%Y %H:%M')}\n"
-            f"• 🔗 Источник: Google Sheets\n\n"
-            f"<i>База работает в реальном времени</i>"
-        )
-    else:
-        response = "⚠️ База временно недоступна"
-
-    await message.answer(response, parse_mode="HTML")
-
-
-@dp.message(Command("help"))
-async def help_cmd(message: Message):
-    help_text = (
-        f"🛡️ <b>Бот антискам базы TRUSTON</b>\n\n"
-        f"<b>Команды:</b>\n"
-        f"• /start - Запуск бота\n"
-        f"• /check - Проверить пользователя\n"
-        f"• /stats - Статистика\n"
-        f"• /help - Справка\n\n"
-        f"<b>Как использовать:</b>\n"
-        f"1. Отправьте ID пользователя (цифры)\n"
-        f"2. Или отправьте @username\n"
-        f"3. Получите результат проверки\n\n"
-        f"<b>Уровни угрозы:</b>\n"
-        f"• 1 - Проверенный\n"
-        f"• 2 - Подозрительный\n"
-        f"• 3 - Мошенник"
-    )
-    await message.answer(help_text, parse_mode="HTML")
-
-
-@dp.message(lambda m: m.text == "🔍 Проверить")
-async def check_button(message: Message):
-    await message.answer("Отправьте ID или @username для проверки:", reply_markup=None)
-
-
-@dp.message(lambda m: m.text == "📊 Статистика")
-async def stats_button(message: Message):
-    await stats(message)
-
-
-@dp.message(lambda m: m.text == "❓ Справка")
-async def help_button(message: Message):
-    await help_cmd(message)
-
-
-@dp.message(lambda m: m.text == "📋 Все записи")
-async def list_all(message: Message):
-    if message.from_user.id != ADMIN_ID:
-        await message.answer("⛔ Нет доступа")
-        return
-
-    sheet = get_google_sheet()
-    if not sheet:
-        await message.answer("⚠️ База недоступна")
-        return
-
-    records = sheet.get_all_records()
-    if not records:
-        await message.answer("📭 База пуста")
-        return
-
-    response = "📋 <b>Последние 10 записей:</b>\n\n"
-    for i, record in enumerate(records[-10:], 1):
-        user_id = record.get('ID', '?')
-        username = record.get('Username', 'нет')
-        level = record.get('Уровень', '3')
-        date = record.get('Дата', '?')
-
-        level_emoji = ["1️⃣", "2️⃣", "3️⃣"][int(level) - 1] if level in ['1', '2', '3'] else "3️⃣"
-        response += f"{i}. {level_emoji} <code>{user_id}</code> (@{username}) - {date}\n"
-
-    response += f"\n<i>Всего записей: {len(records)}</i>"
-    await message.answer(response, parse_mode="HTML")
-
-
-# Поиск пользователя
-@dp.message()
-async def search_user(message: Message):
-    # Пропускаем команды
-    if message.text.startswith('/'):
-        return
-
-    # Пропускаем кнопки
-    if message.text in ["🔍 Проверить", "📊 Статистика", "❓ Справка", "➕ Добавить", "📋 Все записи"]:
-        return
-
-    query = message.text.strip().replace('@', '')
+def sync_from_sheet():
+    """Импортирует записи Google таблицы в базу. Возвращает число новых или None.
 
+    Идёт в потоке, поэтому пишет через своё соединение: курсор общего
+    соединения в это время используют обработчики. Пачки по
+    IMPORT_BATCH_SIZE - отдельные транзакции, запись бота ждёт не дольше пачки"""
     sheet = get_google_sheet()
     if not sheet:
-        await message.answer("⚠️ База временно недоступна. Попробуйте позже.")
-        return
+        return None
 
     records = sheet.get_all_records()
-
-    # Ищем пользователя
-    found = None
+    logger.info(f"📊 Записей в таблице: {len(records)}")
+    rows = []
     for record in records:
-        if query == str(record.get('ID', '')) or query.lower() == str(record.get('Username', '')).lower():
-            found = record
-            break
-
-    if found:
-        user_id = found.get('ID', '?')
-        username = found.get('Username', 'нет')
-        level = found.get('Уровень', '3')
-        reason = found.get('Причина', 'Не указана')
-        proof = found.get('Доказательства', 'Не приложены')
-        date = found.get('Дата', 'Неизвестно')
-
-        # Определяем уровень
-        if level == '1':
-            status = "✅ <b>Проверенный пользователь</b>"
-            advice = "Нареканий нет. Можно проводить сделки."
-        elif level == '2':
-            status = "⚠️ <b>Требует осторожности</b>"
-            advice = "Есть жалобы. Используйте гаранта."
-        else:
-            status = "🚨 <b>Мошенник</b>"
-            advice = "Подтвержденный обман. Сделки запрещены!"
+        level = str(record.get('Уровень', '3'))
+        rows.append((
+            record.get('ID', ''),
+            str(record.get('Username', '')),
+            int(level) if level in ['1', '2', '3'] else 3,
+            record.get('Причина', ''),
+            record.get('Доказательства', ''),
+        ))
+    database = Database(db.db_path, migrate=False)
+    try:
+        return sum(database.import_scammers(rows[i:i + IMPORT_BATCH_SIZE])
+                   for i in range(0, len(rows), IMPORT_BATCH_SIZE))
+    finally:
+        database.conn.close()
 
-        response = (
-            f"{status}\n\n"
-            f"👤 <b>ID:</b> <code>{user_id}</code>\n"
-            f"📛 <b>Юзернейм:</b> @{username}\n"
-            f"📝 <b>Причина:</b> {reason}\n"
-            f"🔗 <b>Доказательства:</b> {proof}\n"
-            f"📅 <b>Дата внесения:</b> {date}\n\n"
-            f"<b>Рекомендации:</b> {advice}\n\n"
-            f"<i>База данных проекта TRUSTON</i>"
-        )
-    else:
-        response = (
-            f"🔍 <b>Поиск:</b> <code>{query}</code>\n\n"
-            f"❌ Не найден в базе.\n"
-            f"✅ Статус: чистый\n\n"
-            f"<i>Пользователь не имеет нареканий в нашей базе</i>"
-        )
 
-    if message.from_user.id == ADMIN_ID:
-        await message.answer(response, parse_mode="HTML", reply_markup=get_admin_keyboard())
+async def sync_in_background():
+    """Синхронизация с таблицей после старта: ответы не ждут скачивания листа"""
+    try:
+        added = await asyncio.to_thread(sync_from_sheet)
+    except Exception as e:
+        logger.error(f"❌ Ошибка синхронизации с Google Sheets: {e}")
+        return
+    if added is not None:
+        logger.info(f"✅ Подключено к Google Sheets, новых записей: {added}")
     else:
-        await message.answer(response, parse_mode="HTML", reply_markup=get_main_keyboard())
+        logger.warning("⚠️ Google Sheets недоступен. Бот работает по локальной базе.")
 
 
 # Запуск
-async def main():
+async def main(workers=0):
     logger.info("🤖 Бот TRUSTON запускается...")
 
-    # Тестируем подключение к Google Sheets
-    sheet = get_google_sheet()
-    if sheet:
-        logger.info("✅ Подключено к Google Sheets")
-        records = len(sheet.get_all_records())
-        logger.info(f"📊 Записей в базе: {records}")
-    else:
-        logger.warning("⚠️ Google Sheets недоступен. Бот будет работать в режиме чтения.")
-
-    await dp.start_polling(bot)
+    bot = create_bot()
+    dp = create_dispatcher(shared=workers > 0)
+    # База открывается в потоке, пока идёт getMe (start_polling возьмёт его из кэша)
+    await asyncio.gather(asyncio.to_thread(db.instance), bot.me())
+
+    # Снапшот открывается за миллисекунды; проверку суммы, пересборку и новые
+    # версии после правок базы ведёт одна задача - publish_snapshots
+    lookup.use_snapshot(SNAPSHOT_PATH, db)
+    snapshot_ready = asyncio.Event()
+    publisher = asyncio.create_task(publish_snapshots(db, SNAPSHOT_PATH, SNAPSHOT_PUBLISH_INTERVAL,
+                                                      lookup.reader, snapshot_ready))
+    sync_task = asyncio.create_task(sync_in_background())
+    # Индекс похожих юзернеймов строится в потоке; до готовности нечёткий поиск пуст
+    fuzzy_task = asyncio.create_task(fuzzy_index.warm())
+    prefix_task = asyncio.create_task(prefix_index.warm())
+    # Обслуживание базы - только в процессе, который в неё пишет
+    maintenance = asyncio.create_task(MaintenanceScheduler(db.db_path).run())
+    metrics_task = asyncio.create_task(log_metrics(METRICS_LOG_INTERVAL))
+
+    # По SIGTERM: дождаться обработчиков, разослать очереди, сбросить WAL, подтвердить offset
+    shutdown = GracefulShutdown(SHUTDOWN_TIMEOUT)
+    shutdown.install(dp)
+
+    async def stop_background():
+        for task in (sync_task, fuzzy_task, prefix_task, publisher, maintenance, metrics_task):
+            task.cancel()
+
+    async def checkpoint():
+        await asyncio.to_thread(db.checkpoint)
+
+    shutdown.add_cleanup(stop_background)
+    shutdown.add_cleanup(join_checker.close)
+    try:
+        if workers > 0:
+            from cluster import run_coordinator
+            await run_coordinator(bot, dp, workers, shutdown, snapshot_ready)
+        else:
+            shutdown.add_cleanup(checkpoint)
+            await dp.start_polling(bot)
+    finally:
+        for task in (sync_task, fuzzy_task, prefix_task, publisher, maintenance, metrics_task):
+            task.cancel()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Бот антискам базы TRUSTON")
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help="число процессов-воркеров (0 - один процесс)")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="замерить импорт и инициализацию по модулям и выйти")
+    args = parser.parse_args()
+    setup_logging()
+    if args.profile_startup:
+        from startup_profile import profile_startup
+        profile_startup()
+    else:
+        asyncio.run(main(args.workers))
@@ -0,0 +1,161 @@
+"""
+Фоновое обслуживание базы: статистика планировщика, WAL, свободные страницы
+
+Задачи идут в самом процессе бота, каждая - на отдельном соединении в
+потоке, чтобы не занимать соединение обработчиков. Интервалы со
+случайным разбросом (jitter): перезапущенные вместе процессы не
+обслуживают базу одновременно. Тяжёлые задачи ждут тихого окна - ночных
+часов MAINTENANCE_QUIET_HOURS или минуты, за которую пришло мало апдейтов,
+- но не дольше одного лишнего интервала. Исключение - полный VACUUM при
+переводе старой базы на incremental vacuum: он держит блокировку записи
+всё время работы и запускается только в тихом окне, без поблажки по сроку.
+
+Всё делается понемногу: checkpoint PASSIVE не ждёт читателей,
+incremental_vacuum освобождает ограниченное число страниц за раз.
+Размер базы, свободные страницы, размер WAL и длительности задач
+попадают в metrics.
+"""
+
+import asyncio
+import logging
+import os
+import random
+import sqlite3
+import time
+from datetime import datetime
+
+from config import (MAINTENANCE_JITTER, MAINTENANCE_QUIET_HOURS, MAINTENANCE_QUIET_RATE,
+                    MAINTENANCE_VACUUM_PAGES, MAINTENANCE_FREE_RATIO)
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Как часто проверять, не пора ли запускать задачи
+TICK = 30
+
+
+class Task:
+    def __init__(self, name, interval, func, quiet=False):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self.quiet = quiet
+        self.due = 0.0
+        self.schedule(time.monotonic())
+
+    def schedule(self, now):
+        self.due = now + self.interval * random.uniform(1 - MAINTENANCE_JITTER, 1 + MAINTENANCE_JITTER)
+
+    def overdue(self, now):
+        """Отложено тихим окном дольше, чем на интервал - запускаем как есть"""
+        return now - self.due > self.interval
+
+
+class MaintenanceScheduler:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.tasks = [
+            Task('stats', 60, self.collect_stats),
+            Task('checkpoint', 300, self.checkpoint),
+            Task('optimize', 3600, self.optimize, quiet=True),
+            Task('vacuum', 3600, self.vacuum, quiet=True),
+            Task('analyze', 24 * 3600, self.analyze, quiet=True),
+        ]
+        self._updates_seen = metrics.counter('updates')
+        self._rate_checked = time.monotonic()
+        # Результат is_quiet() последней проверки - его видят задачи в потоке
+        self.quiet = False
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('PRAGMA busy_timeout=5000')
+        return conn
+
+    def is_quiet(self):
+        """Ночное окно или мало апдейтов с прошлой проверки"""
+        start, end = MAINTENANCE_QUIET_HOURS
+        hour = datetime.now().hour
+        if (start <= hour < end) if start <= end else (hour >= start or hour < end):
+            return True
+        now = time.monotonic()
+        updates = metrics.counter('updates')
+        rate = (updates - self._updates_seen) * 60 / max(now - self._rate_checked, 1)
+        self._updates_seen, self._rate_checked = updates, now
+        return rate < MAINTENANCE_QUIET_RATE
+
+    # ============ ЗАДАЧИ ============
+    def collect_stats(self, conn):
+        page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+        page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+        free_pages = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        wal_path = f"{self.db_path}-wal"
+        metrics.set('db.size_bytes', page_size * page_count)
+        metrics.set('db.free_pages', free_pages)
+        metrics.set('db.free_ratio', round(free_pages / page_count, 4) if page_count else 0.0)
+        metrics.set('db.wal_bytes', os.path.getsize(wal_path) if os.path.exists(wal_path) else 0)
+
+    def checkpoint(self, conn):
+        # PASSIVE переносит то, что можно, не дожидаясь читателей и писателей
+        busy, log_pages, moved = conn.execute('PRAGMA wal_checkpoint(PASSIVE)').fetchone()
+        metrics.set('db.wal_pages', log_pages)
+        metrics.set('db.wal_checkpointed_pages', moved)
+
+    def optimize(self, conn):
+        # Лимит анализа: на большой таблице optimize смотрит выборку, а не всю таблицу
+        conn.execute('PRAGMA analysis_limit=1000')
+        conn.execute('PRAGMA optimize')
+
+    def analyze(self, conn):
+        conn.execute('PRAGMA analysis_limit=1000')
+        conn.execute('ANALYZE')
+
+    def vacuum(self, conn):
+        free_pages = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        if not free_pages:
+            return
+        auto_vacuum = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+        if auto_vacuum == 2:
+            # INCREMENTAL: отдаём файлу ограниченное число страниц за раз
+            conn.execute(f'PRAGMA incremental_vacuum({MAINTENANCE_VACUUM_PAGES})').fetchall()
+            metrics.inc('db.vacuumed_pages', min(free_pages, MAINTENANCE_VACUUM_PAGES))
+            return
+        page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+        if free_pages / page_count < MAINTENANCE_FREE_RATIO:
+            return
+        # База создана без auto_vacuum: включить его можно только полным VACUUM.
+        # Делается один раз и только в тихом окне (не по overdue): пока он идёт,
+        # запись обработчиков падает с "database is locked"; дальше - incremental_vacuum
+        if not self.quiet:
+            logger.info(f"🧹 Полный VACUUM отложен до тихого окна ({free_pages} из {page_count} страниц свободны)")
+            return
+        logger.info(f"🧹 Свободно {free_pages} из {page_count} страниц, перевожу базу на incremental vacuum")
+        conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        conn.execute('VACUUM')
+
+    # ============ ЗАПУСК ============
+    def run_task(self, task):
+        started = time.perf_counter()
+        conn = self._connect()
+        try:
+            task.func(conn)
+        finally:
+            conn.close()
+            metrics.observe(f'maintenance.{task.name}', (time.perf_counter() - started) * 1000)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(TICK)
+            now = time.monotonic()
+            due = [task for task in self.tasks if task.due <= now]
+            if not due:
+                continue
+            quiet = self.quiet = self.is_quiet()
+            for task in due:
+                if task.quiet and not quiet and not task.overdue(now):
+                    continue
+                try:
+                    await asyncio.to_thread(self.run_task, task)
+                except Exception as e:
+                    metrics.inc(f'maintenance.{task.name}.errors')
+                    logger.error(f"❌ Обслуживание базы ({task.name}): {e}")
+                task.schedule(time.monotonic())
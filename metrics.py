@@ -0,0 +1,102 @@
+"""
+Метрики процесса: счётчики, текущие значения и длительности
+
+Реестр живёт в памяти процесса; значения читает админ-команда и
+периодически пишет в лог (одна JSON-запись "metrics" со всеми полями),
+откуда их забирает любой сборщик логов. Обновление - словарь под
+блокировкой, поэтому метрики можно писать и из потоков (to_thread).
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class Timing:
+    """Сводка длительностей: количество, сумма, максимум, последнее (мс)"""
+
+    __slots__ = ('count', 'total', 'max', 'last')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def add(self, ms):
+        self.count += 1
+        self.total += ms
+        self.last = ms
+        if ms > self.max:
+            self.max = ms
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'avg_ms': round(self.total / self.count, 2) if self.count else 0.0,
+            'max_ms': round(self.max, 2),
+            'last_ms': round(self.last, 2),
+        }
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._timings = {}
+
+    def inc(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set(self, name, value):
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name, ms):
+        with self._lock:
+            timing = self._timings.get(name)
+            if timing is None:
+                timing = self._timings[name] = Timing()
+            timing.add(ms)
+
+    @contextmanager
+    def timer(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, (time.perf_counter() - started) * 1000)
+
+    def counter(self, name):
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def snapshot(self):
+        """Все метрики одним плоским словарём"""
+        with self._lock:
+            result = dict(self._counters)
+            result.update(self._gauges)
+            for name, timing in self._timings.items():
+                for key, value in timing.as_dict().items():
+                    result[f"{name}.{key}"] = value
+        return result
+
+    def render(self):
+        """Текст для ответа админу"""
+        return "\n".join(f"{name}: {value}" for name, value in sorted(self.snapshot().items()))
+
+
+metrics = Metrics()
+
+
+async def log_metrics(interval):
+    """Пишет снимок метрик в лог раз в interval секунд"""
+    while True:
+        await asyncio.sleep(interval)
+        logger.info("metrics", extra={'fields': metrics.snapshot()})
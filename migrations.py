@@ -0,0 +1,332 @@
+"""
+Версионированные миграции схемы и фоновые дозаполнения (backfill)
+
+Версия схемы хранится в таблице schema_version. При открытии базы
+применяются только миграции с номером больше последнего применённого,
+каждая - в своей транзакции вместе с отметкой о версии. Миграции
+идемпотентны (IF NOT EXISTS, проверка колонок), поэтому базы, созданные
+до появления schema_version, доводятся до текущей схемы без потерь.
+
+Сама миграция делает только быстрые изменения схемы. Перенос данных в
+новую колонку или таблицу ставится в очередь backfills и идёт в фоновом
+потоке пачками по rowid: каждая пачка - короткая транзакция, так что
+запись бота ждёт не дольше одной пачки, а чтения (WAL) не ждут совсем.
+Позиция сохраняется в той же транзакции, что и пачка, - после
+перезапуска дозаполнение продолжается с места остановки.
+
+Новая миграция - функция fn(cursor) в конце MIGRATIONS со следующим номером.
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+
+from config import THREAT_LEVELS, BACKFILL_BATCH_SIZE, BACKFILL_PAUSE
+
+logger = logging.getLogger(__name__)
+
+
+def _table_exists(cursor, table):
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table,))
+    return cursor.fetchone() is not None
+
+
+def _add_column_if_missing(cursor, table, column, ddl):
+    """Добавляет колонку если её нет. Возвращает True если добавил"""
+    cursor.execute(f"PRAGMA table_info({table})")
+    columns = [col[1] for col in cursor.fetchall()]
+    if column in columns:
+        return False
+    logger.info(f"➕ Добавляю колонку {table}.{column}")
+    cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+    return True
+
+
+def _enqueue_backfill(cursor, name, table):
+    """Ставит дозаполнение строк table, существующих на момент миграции"""
+    until_rowid = cursor.execute(f'SELECT MAX(rowid) FROM {table}').fetchone()[0] or 0
+    cursor.execute('''
+        INSERT OR REPLACE INTO backfills (name, last_rowid, until_rowid, done)
+        VALUES (?, 0, ?, ?)
+    ''', (name, until_rowid, int(until_rowid == 0)))
+
+
+# ============ МИГРАЦИИ ============
+def _create_base(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scammers
+        (
+            id           INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id      TEXT UNIQUE NOT NULL,
+            username     TEXT,
+            threat_level INTEGER DEFAULT 3,
+            reason       TEXT,
+            proof        TEXT,
+            added_date   TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    # Журнал изменений: только дописывается, seq растёт монотонно
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS changes
+        (
+            seq          INTEGER PRIMARY KEY AUTOINCREMENT,
+            op           TEXT NOT NULL,
+            user_id      TEXT NOT NULL,
+            old_username TEXT,
+            new_username TEXT,
+            admin_id     INTEGER,
+            created_at   TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def _create_reports(cursor):
+    # Жалобы: по несколько на одного пользователя
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS reports
+        (
+            id           INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id      TEXT NOT NULL,
+            reporter_id  INTEGER,
+            reason       TEXT,
+            proof        TEXT,
+            threat_level INTEGER DEFAULT 3,
+            created_at   TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_reports_user_id ON reports (user_id)')
+
+    # Материализованный рейтинг: поддерживается при добавлении/удалении жалоб,
+    # чтобы find_user отдавал вердикт одним чтением по индексу
+    if _add_column_if_missing(cursor, 'scammers', 'reports_count', 'INTEGER DEFAULT 0'):
+        _add_column_if_missing(cursor, 'scammers', 'score', 'INTEGER DEFAULT 0')
+        _enqueue_backfill(cursor, 'reports', 'scammers')
+
+
+def _create_aliases(cursor):
+    # История юзернеймов: любой когда-либо виденный @username -> user_id
+    aliases_exist = _table_exists(cursor, 'username_aliases')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS username_aliases
+        (
+            username_norm TEXT NOT NULL,
+            username      TEXT NOT NULL,
+            user_id       TEXT NOT NULL,
+            source        TEXT,
+            first_seen    TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_seen     TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_aliases_username_norm
+        ON username_aliases (username_norm)
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_aliases_user_id ON username_aliases (user_id)')
+    if not aliases_exist:
+        _enqueue_backfill(cursor, 'aliases', 'scammers')
+
+
+def _create_proofs(cursor):
+    # Файлы-доказательства: один раз на каждый уникальный файл Telegram
+    # (file_unique_id одинаков у одного и того же скриншота от разных людей),
+    # file_id хранится для повторной отправки без загрузки
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS proof_files
+        (
+            file_unique_id TEXT PRIMARY KEY,
+            file_id        TEXT NOT NULL,
+            file_type      TEXT NOT NULL,
+            uploaded_by    INTEGER,
+            created_at     TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    # Какие файлы к какой записи приложены
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS proof_links
+        (
+            user_id        TEXT NOT NULL,
+            file_unique_id TEXT NOT NULL REFERENCES proof_files (file_unique_id),
+            added_by       INTEGER,
+            created_at     TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, file_unique_id)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_proof_links_file ON proof_links (file_unique_id)')
+
+
+# (версия, описание, функция) строго по возрастанию версии
+MIGRATIONS = [
+    (1, "записи и журнал изменений", _create_base),
+    (2, "жалобы и рейтинг угрозы", _create_reports),
+    (3, "история юзернеймов", _create_aliases),
+    (4, "файлы-доказательства", _create_proofs),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def _create_meta(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version
+        (
+            version    INTEGER PRIMARY KEY,
+            name       TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS backfills
+        (
+            name        TEXT PRIMARY KEY,
+            last_rowid  INTEGER NOT NULL DEFAULT 0,
+            until_rowid INTEGER NOT NULL,
+            done        INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+
+
+def current_version(conn):
+    row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    return row[0] or 0
+
+
+def migrate(conn):
+    """Применяет недостающие миграции. Возвращает номер версии схемы"""
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        _create_meta(cursor)
+    except Exception:
+        conn.rollback()
+        raise
+    conn.commit()
+
+    for version, name, migration in MIGRATIONS:
+        # Версию проверяем под блокировкой записи: другой процесс бота
+        # мог применить эту миграцию, пока мы ждали
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            if current_version(conn) >= version:
+                conn.rollback()
+                continue
+            logger.info(f"🔧 Миграция {version}: {name}")
+            migration(cursor)
+            cursor.execute('INSERT INTO schema_version (version, name) VALUES (?, ?)', (version, name))
+        except Exception:
+            conn.rollback()
+            logger.error(f"❌ Миграция {version} не применена")
+            raise
+        conn.commit()
+    return current_version(conn)
+
+
+# ============ ДОЗАПОЛНЕНИЯ ============
+_SCORE_CASE = "CASE r.threat_level {} ELSE {} END".format(
+    " ".join(f"WHEN {level} THEN {info['weight']}" for level, info in THREAT_LEVELS.items()),
+    THREAT_LEVELS[3]['weight'],
+)
+
+# Запросы одной пачки: строки scammers с id в (:start, :end]
+BACKFILLS = {
+    # Старые записи (одна запись = одна жалоба) переносятся в reports,
+    # рейтинг пересчитывается по жалобам
+    'reports': [
+        '''
+        INSERT INTO reports (user_id, reason, proof, threat_level, created_at)
+        SELECT s.user_id, s.reason, s.proof, s.threat_level, s.added_date
+        FROM scammers s
+        WHERE s.id > :start AND s.id <= :end
+          AND NOT EXISTS (SELECT 1 FROM reports r WHERE r.user_id = s.user_id)
+        ''',
+        f'''
+        UPDATE scammers SET
+            reports_count = (SELECT COUNT(*) FROM reports r WHERE r.user_id = scammers.user_id),
+            score = (SELECT COALESCE(SUM({_SCORE_CASE}), 0) FROM reports r WHERE r.user_id = scammers.user_id)
+        WHERE id > :start AND id <= :end
+        ''',
+    ],
+    # Юзернеймы Telegram только ASCII, так что lower() в SQLite совпадает с normalize_username
+    'aliases': [
+        '''
+        INSERT OR IGNORE INTO username_aliases (username_norm, username, user_id, source, first_seen)
+        SELECT lower(username), username, user_id, 'admin', added_date
+        FROM scammers
+        WHERE id > :start AND id <= :end AND username IS NOT NULL AND username != ''
+        ''',
+    ],
+}
+
+# Записи пачки попадают в журнал изменений: снапшот и индексы подхватят их как обычную правку
+_LOG_BATCH = '''
+    INSERT INTO changes (op, user_id, old_username, new_username)
+    SELECT 'update', user_id, username, username
+    FROM scammers
+    WHERE id > :start AND id <= :end
+'''
+
+
+def _run_batch(conn, name, batch_size):
+    """Одна пачка в своей транзакции. Возвращает False, когда дозаполнение закончено"""
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        row = cursor.execute('SELECT last_rowid, until_rowid, done FROM backfills WHERE name = ?',
+                             (name,)).fetchone()
+        if row is None or row[2]:
+            conn.rollback()
+            return False
+        start, until_rowid, _ = row
+        end = min(start + batch_size, until_rowid)
+        params = {'start': start, 'end': end}
+        for statement in BACKFILLS[name]:
+            cursor.execute(statement, params)
+        cursor.execute(_LOG_BATCH, params)
+        cursor.execute('UPDATE backfills SET last_rowid = ?, done = ? WHERE name = ?',
+                       (end, int(end >= until_rowid), name))
+    except Exception:
+        conn.rollback()
+        raise
+    conn.commit()
+    return end < until_rowid
+
+
+def pending_backfills(conn):
+    """[(name, last_rowid, until_rowid)] незаконченных дозаполнений"""
+    return conn.execute('SELECT name, last_rowid, until_rowid FROM backfills WHERE done = 0 ORDER BY name').fetchall()
+
+
+def run_backfills(db_path, batch_size=BACKFILL_BATCH_SIZE, pause=BACKFILL_PAUSE):
+    """Доводит все дозаполнения до конца на отдельном соединении"""
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA busy_timeout=5000')
+    try:
+        for name, last_rowid, until_rowid in pending_backfills(conn):
+            if name not in BACKFILLS:
+                logger.warning(f"⚠️ Неизвестное дозаполнение {name}, пропускаю")
+                continue
+            logger.info(f"🔄 Дозаполнение {name}: строки {last_rowid + 1}..{until_rowid}")
+            started = time.monotonic()
+            while _run_batch(conn, name, batch_size):
+                # Пауза между пачками отдаёт блокировку записи боту
+                time.sleep(pause)
+            logger.info(f"✅ Дозаполнение {name} завершено за {time.monotonic() - started:.1f} с")
+    finally:
+        conn.close()
+
+
+def start_backfills(conn, db_path):
+    """Запускает незаконченные дозаполнения в фоновом потоке (если они есть)"""
+    if not pending_backfills(conn):
+        return None
+
+    def run():
+        try:
+            run_backfills(db_path)
+        except Exception as e:
+            # Позиция сохранена, при следующем запуске продолжится с неё
+            logger.error(f"❌ Ошибка дозаполнения: {e}")
+
+    thread = threading.Thread(target=run, name="backfill", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,137 @@
+"""
+Префиксный индекс для inline-режима: автодополнение по юзернейму и ID
+
+Отсортированный массив пар (ключ, user_id) в памяти + bisect: поиск
+по префиксу - O(log n) и проход по соседним элементам, без запросов к
+базе. Индекс догружает только дельты из журнала изменений.
+
+Полная загрузка идёт в потоке при старте (warm) по отдельному соединению
+только для чтения; пока она не закончилась, ready = False. Если журнал
+ушёл вперёд больше чем на INDEX_REBUILD_LAG изменений, индекс
+перестраивается в потоке целиком, а не догоняется вставками в список.
+"""
+
+import asyncio
+import bisect
+import logging
+import time
+
+from config import INDEX_REBUILD_LAG
+from database import ChangeLogReader, db, read_transaction
+from utils import normalize_username
+
+logger = logging.getLogger(__name__)
+
+# Не чаще раза в секунду сверяемся с журналом: inline-запросы идут на каждое нажатие
+SYNC_INTERVAL = 1.0
+
+
+class PrefixIndex:
+    """Отсортированные нормализованные ключи (юзернеймы и ID) -> user_id"""
+
+    def __init__(self, database):
+        self.database = database
+        self.reader = None
+        self.entries = []
+        self.synced_at = 0.0
+        self.rebuilding = None
+
+    def _insert(self, key, user_id):
+        entry = (key, user_id)
+        i = bisect.bisect_left(self.entries, entry)
+        if i == len(self.entries) or self.entries[i] != entry:
+            self.entries.insert(i, entry)
+
+    def _delete(self, key, user_id):
+        entry = (key, user_id)
+        i = bisect.bisect_left(self.entries, entry)
+        if i < len(self.entries) and self.entries[i] == entry:
+            del self.entries[i]
+
+    @property
+    def ready(self):
+        return self.reader is not None
+
+    def _build(self):
+        """Полная загрузка на своём соединении; возвращает (ключи, читатель журнала)"""
+        started = time.perf_counter()
+        entries = []
+        with read_transaction(self.database.db_path) as reader:
+            # Курсор журнала и строки - из одной транзакции чтения
+            seq = reader.get_last_change_seq()
+            for user_id, username in reader.get_user_keys():
+                entries.append((user_id, user_id))
+                if username:
+                    entries.append((normalize_username(username), user_id))
+        entries.sort()
+        logger.info(f"🔡 Префиксный индекс: {len(entries)} ключей за {time.perf_counter() - started:.2f} с")
+        return entries, ChangeLogReader(self.database, seq)
+
+    def load(self):
+        """Полная загрузка синхронно (скрипты, startup_profile.py)"""
+        self.entries, self.reader = self._build()
+        self.synced_at = time.monotonic()
+
+    async def warm(self):
+        """Строит (или перестраивает) индекс в потоке, не блокируя обработку апдейтов"""
+        try:
+            entries, reader = await asyncio.to_thread(self._build)
+        except Exception as e:
+            logger.error(f"❌ Не удалось построить префиксный индекс: {e}")
+            return
+        finally:
+            self.rebuilding = None
+        self.entries, self.reader = entries, reader
+        self.synced_at = time.monotonic()
+
+    def apply(self, change):
+        """Применяет одно изменение из журнала"""
+        # Дозаполнения пишут 'update' без смены юзернейма - вставка в список не нужна
+        if change.op == 'update' and change.old_username == change.new_username:
+            return
+        if change.old_username:
+            self._delete(normalize_username(change.old_username), change.user_id)
+        if change.op == 'delete':
+            self._delete(change.user_id, change.user_id)
+            return
+        self._insert(change.user_id, change.user_id)
+        if change.new_username:
+            self._insert(normalize_username(change.new_username), change.user_id)
+
+    def sync(self, force=False):
+        if not self.ready or self.rebuilding is not None:
+            return
+        if not force and time.monotonic() - self.synced_at < SYNC_INTERVAL:
+            return
+        self.synced_at = time.monotonic()
+        if self.database.get_last_change_seq() - self.reader.cursor > INDEX_REBUILD_LAG:
+            # Догонять по одному изменению дольше, чем построить заново
+            self.rebuilding = asyncio.create_task(self.warm())
+            return
+        while True:
+            changes = self.reader.poll()
+            for change in changes:
+                self.apply(change)
+            if not changes:
+                break
+
+    def search(self, prefix, limit=10):
+        """Первые limit разных user_id, у которых ключ начинается с prefix
+        ([] пока индекс не построен - см. ready)"""
+        self.sync()
+        prefix = normalize_username(prefix)
+        if not prefix:
+            return []
+        found = []
+        i = bisect.bisect_left(self.entries, (prefix,))
+        while i < len(self.entries) and len(found) < limit:
+            key, user_id = self.entries[i]
+            if not key.startswith(prefix):
+                break
+            if user_id not in found:
+                found.append(user_id)
+            i += 1
+        return found
+
+
+prefix_index = PrefixIndex(db)
@@ -0,0 +1,54 @@
+"""
+Файлы-доказательства: приём из сообщений и отправка альбомами
+
+Файлы не скачиваются и не загружаются заново: храним file_id, который
+Telegram выдал боту, и отправляем по нему. Документы нельзя смешивать
+в одном альбоме с фото, а в альбоме не больше 10 файлов - поэтому файлы
+группируются по типу и режутся на пачки.
+"""
+
+from aiogram.types import InputMediaPhoto, InputMediaDocument
+
+MEDIA_GROUP_LIMIT = 10
+
+MEDIA_TYPES = {
+    'photo': InputMediaPhoto,
+    'document': InputMediaDocument,
+}
+
+
+def extract_file(message):
+    """(file_unique_id, file_id, file_type) из сообщения или None"""
+    if message.photo:
+        # Telegram присылает несколько размеров, последний - самый большой
+        photo = message.photo[-1]
+        return photo.file_unique_id, photo.file_id, 'photo'
+    if message.document:
+        return message.document.file_unique_id, message.document.file_id, 'document'
+    return None
+
+
+def media_batches(files):
+    """Делит [(file_id, file_type)] на пачки одного типа по MEDIA_GROUP_LIMIT"""
+    by_type = {}
+    for file_id, file_type in files:
+        by_type.setdefault(file_type, []).append(file_id)
+    for file_type, file_ids in by_type.items():
+        for start in range(0, len(file_ids), MEDIA_GROUP_LIMIT):
+            yield file_type, file_ids[start:start + MEDIA_GROUP_LIMIT]
+
+
+async def send_proofs(bot, chat_id, files):
+    """Отправляет доказательства альбомами; подпись - у первого файла"""
+    caption = f"📎 Доказательства ({len(files)})"
+    for file_type, file_ids in media_batches(files):
+        if len(file_ids) == 1:
+            # Альбом - от 2 файлов, одиночный файл уходит обычным сообщением
+            send = bot.send_photo if file_type == 'photo' else bot.send_document
+            await send(chat_id, file_ids[0], caption=caption)
+        else:
+            media_type = MEDIA_TYPES.get(file_type, InputMediaDocument)
+            media = [media_type(media=file_id, caption=caption if i == 0 else None)
+                     for i, file_id in enumerate(file_ids)]
+            await bot.send_media_group(chat_id, media)
+        caption = None
@@ -0,0 +1,97 @@
+"""
+Тексты ответов: готовые шаблоны и кэш карточек
+
+Статичные тексты собираются один раз при импорте, карточки - по шаблону
+своего уровня угрозы, где эмодзи и название уровня уже подставлены.
+Готовая карточка кэшируется; ключ - сама запись: любое её изменение
+(жалоба, переименование, смена уровня) даёт другой кортеж, то есть новую
+версию, поэтому устаревшая карточка из кэша не вернётся.
+"""
+
+import html
+from datetime import datetime
+from functools import lru_cache
+
+from config import THREAT_LEVELS, PROJECT_NAME, CARD_CACHE_SIZE
+
+WELCOME_TEXT = (
+    f"🛡️ <b>Добро пожаловать в бота с нашей антискам базой проекта {PROJECT_NAME}!</b>\n\n"
+    f"Я помогаю проверять пользователей на наличие жалоб и предупреждений о мошенничестве.\n\n"
+    f"<b>Как использовать:</b>\n"
+    f"• Отправьте <b>ID</b> пользователя (только цифры)\n"
+    f"• Или отправьте <b>@username</b> (без @ или с ним)\n\n"
+    f"<i>База обновляется командой {PROJECT_NAME} для безопасности сообщества</i>"
+)
+
+HELP_TEXT = (
+    f"🛡️ <b>Справка по боту {PROJECT_NAME}</b>\n\n"
+    f"<b>Основные команды:</b>\n"
+    f"• /start - Запустить бота\n"
+    f"• /check - Проверить пользователя\n"
+    f"• /add - Добавить запись (админы)\n"
+    f"• /stats - Статистика базы\n"
+    f"• /help - Эта справка\n\n"
+    f"<b>Уровни угрозы:</b>\n"
+    f"• 1️⃣ - Проверенный\n"
+    f"• 2️⃣ - Подозрительный\n"
+    f"• 3️⃣ - Мошенник\n\n"
+    f"<b>Просто отправьте ID или @username для проверки!</b>"
+)
+
+NOT_FOUND_TEMPLATE = "🔍 <b>Поиск:</b> <code>{query}</code>\n\n❌ Не найден в базе.\n✅ Статус: чистый"
+
+_CARD_BODY = (
+    "{found_note}"
+    "👤 <b>ID:</b> <code>{user_id}</code>\n"
+    "📛 <b>Юзернейм:</b> @{username}\n"
+    "🕓 <b>Прежние юзернеймы:</b> {history}\n"
+    "📝 <b>Причина:</b> {reason}\n"
+    "🔗 <b>Доказательства:</b> {proof}\n"
+    "📨 <b>Жалоб:</b> {reports_count} (рейтинг угрозы: {score})\n"
+    "📅 <b>Дата внесения:</b> {date}\n\n"
+    f"<i>База данных проекта {PROJECT_NAME}</i>"
+)
+
+# Шаблон карточки для каждого уровня угрозы
+CARD_TEMPLATES = {
+    level: f"{info['emoji']} <b>{info['name']}</b>\n\n" + _CARD_BODY
+    for level, info in THREAT_LEVELS.items()
+}
+
+
+STATS_TEMPLATE = (
+    f"📊 <b>Статистика базы {PROJECT_NAME}</b>\n\n"
+    "• 📁 Всего записей: <b>{total}</b>\n"
+    "• 📅 Последнее обновление: {now}\n\n"
+    "<i>База работает и обновляется</i>"
+)
+
+
+def stats(total):
+    return STATS_TEMPLATE.format(total=total, now=datetime.now().strftime('%d.%m.%Y %H:%M'))
+
+
+def not_found(query):
+    # Запрос вводит пользователь: "<" или "&" ломают разметку, и Telegram отклоняет ответ
+    return NOT_FOUND_TEMPLATE.format(query=html.escape(query))
+
+
+@lru_cache(maxsize=CARD_CACHE_SIZE)
+def _user_card(user_data, old_usernames, found_note):
+    user_id, username, level, reason, proof, date, reports_count, score = user_data
+    return CARD_TEMPLATES.get(level, CARD_TEMPLATES[3]).format(
+        found_note=found_note,
+        user_id=user_id,
+        username=username or 'не указан',
+        history=", ".join(f"@{alias}" for alias in old_usernames) or "нет",
+        reason=reason or 'Не указана',
+        proof=proof or 'Не приложены',
+        reports_count=reports_count or 0,
+        score=score or 0,
+        date=date or 'Неизвестно',
+    )
+
+
+def user_card(user_data, old_usernames=(), found_note=""):
+    """Карточка записи из базы для ответа"""
+    return _user_card(tuple(user_data), tuple(old_usernames or ()), found_note)
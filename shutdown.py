@@ -0,0 +1,113 @@
+"""
+Мягкая остановка бота (SIGTERM от супервизора или Railway)
+
+aiogram по сигналу перестаёт забирать апдейты и вызывает shutdown, но уже
+запущенные обработчики не ждёт: сессия закрывается под ними, и админ может
+остаться без подтверждения после add_scammer. Здесь shutdown по порядку:
+  1. ждёт обработчики в работе;
+  2. выполняет очистку в порядке add_cleanup (фоновые задачи, очереди
+     отправки, воркеры, checkpoint WAL);
+  3. закрывает хранилище FSM - обработчики и воркеры уже не пишут в него;
+  4. подтверждает Telegram offset: всё, что обработано, больше не придёт,
+     а всё, что не успели обработать, придёт следующему процессу.
+Шаги 1-2 укладываются в один общий срок SHUTDOWN_TIMEOUT (remaining()),
+который меньше STOP_TIMEOUT супервизора.
+"""
+
+import asyncio
+import logging
+import time
+
+from aiogram import BaseMiddleware
+
+logger = logging.getLogger(__name__)
+
+
+class InFlightTracker(BaseMiddleware):
+    """Внешний middleware: какие апдейты сейчас в обработке"""
+
+    def __init__(self):
+        self.active = set()
+        self.last_update_id = None
+        self.idle = asyncio.Event()
+        self.idle.set()
+
+    async def __call__(self, handler, event, data):
+        update_id = event.update_id
+        if self.last_update_id is None or update_id > self.last_update_id:
+            self.last_update_id = update_id
+        self.active.add(update_id)
+        self.idle.clear()
+        try:
+            return await handler(event, data)
+        finally:
+            self.active.discard(update_id)
+            if not self.active:
+                self.idle.set()
+
+    def ack_offset(self):
+        """Offset для getUpdates: первый апдейт, который нужно получить снова"""
+        if self.active:
+            return min(self.active)
+        if self.last_update_id is None:
+            return None
+        return self.last_update_id + 1
+
+
+class GracefulShutdown:
+    def __init__(self, timeout):
+        # Общий срок на ожидание обработчиков и очистку, отсчитывается от начала остановки
+        self.timeout = timeout
+        self.deadline = None
+        self.tracker = InFlightTracker()
+        self.cleanups = []
+        self.storage = None
+
+    def install(self, dp):
+        dp.update.outer_middleware(self.tracker)
+        dp.shutdown.register(self.on_shutdown)
+        # dp.fsm.close вызывается раньше on_shutdown - хранилище закрываем сами, последним
+        self.storage = dp.fsm.storage
+        self.storage.defer_close()
+
+    def add_cleanup(self, callback):
+        """Асинхронная функция без аргументов, вызывается после ожидания обработчиков"""
+        self.cleanups.append(callback)
+
+    def remaining(self):
+        """Сколько секунд осталось от общего срока остановки"""
+        if self.deadline is None:
+            return self.timeout
+        return max(0.0, self.deadline - time.monotonic())
+
+    async def on_shutdown(self, bot):
+        self.deadline = time.monotonic() + self.timeout
+        if self.tracker.active:
+            logger.info(f"⏳ Ждём апдейты в обработке: {len(self.tracker.active)}")
+        try:
+            await asyncio.wait_for(self.tracker.idle.wait(), self.remaining())
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ За {self.timeout} с не завершились апдейты: {sorted(self.tracker.active)}")
+
+        for cleanup in self.cleanups:
+            try:
+                await cleanup()
+            except Exception as e:
+                logger.error(f"❌ Ошибка при остановке ({cleanup.__qualname__}): {e}")
+
+        if self.storage is not None:
+            try:
+                await self.storage.dispose()
+            except Exception as e:
+                logger.error(f"❌ Ошибка при закрытии хранилища FSM: {e}")
+
+        offset = self.tracker.ack_offset()
+        if offset is None:
+            return
+        try:
+            # Апдейты с id < offset Telegram считает подтверждёнными; полученный
+            # здесь апдейт (если есть) не подтверждён и придёт снова
+            await bot.get_updates(offset=offset, limit=1, timeout=0)
+            logger.info(f"✅ Подтверждены апдейты до {offset - 1}")
+        except Exception as e:
+            logger.error(f"❌ Не удалось подтвердить offset {offset}: {e}")
@@ -0,0 +1,314 @@
+"""
+Неизменяемый бинарный снапшот индексов поиска
+
+Файл пишется целиком во временный и атомарно подменяется (os.replace),
+читатели открывают его через mmap и ищут прямо по отображённой памяти:
+бинарный поиск по отсортированному массиву ID и по словарю юзернеймов,
+без загрузки записей в объекты Python. Открытие файла занимает
+миллисекунды при любом размере базы, поэтому снапшот пишется после каждой
+синхронизации и открывается при старте бота вместо перечитывания таблицы.
+
+Формат (все числа little-endian, секции выровнены по 8 байт):
+    заголовок   HEADER (64 байта, последние 4 - CRC32 первых 60)
+    ids         uint64[count]         ID по возрастанию
+    rec_off     uint32[count + 1]     смещения записей в rec_blob
+    name_off    uint32[names + 1]     смещения юзернеймов в name_pool
+    name_rec    uint32[names]         номер записи для каждого юзернейма
+    name_pool   utf-8 юзернеймы (нормализованные), по возрастанию
+    rec_blob    поля записей через RECORD_SEP
+Всё после заголовка покрыто body_crc (CRC32). Файл с неизвестной версией
+формата или с неверной суммой не используется и пересобирается из базы.
+
+Снапшот собирается из потока, поэтому читает базу через своё соединение
+только для чтения: версия и записи берутся в одной транзакции чтения и
+не видят незафиксированных изменений общего соединения бота.
+"""
+
+import asyncio
+import bisect
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from array import array
+
+from database import Database
+from utils import normalize_username, is_user_id
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'TRSNAP01'
+FORMAT_VERSION = 2
+# magic, формат, резерв, версия данных (seq журнала), записей, юзернеймов, размер name_pool,
+# размер rec_blob, CRC32 тела
+HEADER = struct.Struct('<8sIIQQQQQI')
+HEADER_CRC = struct.Struct('<I')
+HEADER_SIZE = HEADER.size + HEADER_CRC.size
+RECORD_SEP = '\x1f'
+# Как часто читатель проверяет, не подменён ли файл
+RELOAD_CHECK_INTERVAL = 0.5
+
+
+def _pad(size):
+    return (8 - size % 8) % 8
+
+
+def _read_rows(db_path):
+    """(версия, записи) из одной транзакции чтения на отдельном соединении"""
+    reader = Database(db_path, readonly=True)
+    try:
+        reader.conn.execute('BEGIN')
+        version = reader.get_last_change_seq()
+        # Строки, записанные до проверки ID, не должны ронять каждую публикацию
+        rows = [row for row in reader.get_snapshot_rows() if is_user_id(row[0])]
+        reader.conn.execute('COMMIT')
+    finally:
+        reader.conn.close()
+    return version, rows
+
+
+def write_snapshot(database, path):
+    """Собирает снапшот из базы и атомарно публикует его. Возвращает версию"""
+    started = time.perf_counter()
+    version, rows = _read_rows(database.db_path)
+    rows.sort(key=lambda row: int(row[0]))
+
+    ids = array('Q')
+    rec_off = array('I', [0])
+    blob = bytearray()
+    names = {}
+    for index, (user_id, username, level, reason, proof, date, reports_count, score, aliases) in enumerate(rows):
+        ids.append(int(user_id))
+        fields = (user_id, username, level, reason, proof, date, reports_count, score, aliases)
+        blob += RECORD_SEP.join('' if value is None else str(value).replace(RECORD_SEP, ' ')
+                                for value in fields).encode('utf-8')
+        rec_off.append(len(blob))
+        for alias in (aliases or '').split(','):
+            if alias:
+                names.setdefault(normalize_username(alias).encode('utf-8'), index)
+        if username:
+            # Текущий юзернейм важнее чужого старого
+            names[normalize_username(username).encode('utf-8')] = index
+
+    name_off = array('I', [0])
+    name_rec = array('I')
+    pool = bytearray()
+    for name in sorted(names):
+        pool += name
+        name_off.append(len(pool))
+        name_rec.append(names[name])
+
+    body = []
+    body_crc = 0
+    for section in (ids.tobytes(), rec_off.tobytes(), name_off.tobytes(), name_rec.tobytes(), bytes(pool), bytes(blob)):
+        for chunk in (section, b'\0' * _pad(len(section))):
+            body.append(chunk)
+            body_crc = zlib.crc32(chunk, body_crc)
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, 0, version, len(ids), len(name_rec), len(pool), len(blob), body_crc)
+
+    # Пишут из разных потоков (проверка при старте, публикация) - у каждого свой файл
+    tmp_path = f"{path}.tmp{os.getpid()}.{threading.get_ident()}"
+    with open(tmp_path, 'wb') as f:
+        f.write(header)
+        f.write(HEADER_CRC.pack(zlib.crc32(header)))
+        for chunk in body:
+            f.write(chunk)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+    logger.info(f"📸 Снапшот v{version}: {len(ids)} записей, {len(name_rec)} юзернеймов, "
+                f"{os.path.getsize(path):,} байт за {time.perf_counter() - started:.2f} с")
+    return version
+
+
+class _Names:
+    """Последовательность юзернеймов поверх mmap для bisect"""
+
+    def __init__(self, offsets, pool):
+        self.offsets = offsets
+        self.pool = pool
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return bytes(self.pool[self.offsets[i]:self.offsets[i + 1]])
+
+
+class Snapshot:
+    """Один открытый файл снапшота; после открытия не меняется"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            stat = os.fstat(f.fileno())
+        self.file_key = (stat.st_ino, stat.st_mtime_ns)
+
+        if len(self.mm) < HEADER_SIZE:
+            raise ValueError("Снапшот обрезан")
+        magic, fmt, _, self.version, count, name_count, pool_size, blob_size, self.body_crc = \
+            HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or fmt != FORMAT_VERSION:
+            raise ValueError(f"Неизвестный формат снапшота: {magic!r} v{fmt}")
+        if HEADER_CRC.unpack_from(self.mm, HEADER.size)[0] != zlib.crc32(self.mm[:HEADER.size]):
+            raise ValueError("Повреждён заголовок снапшота")
+        sizes = (8 * count, 4 * (count + 1), 4 * (name_count + 1), 4 * name_count, pool_size, blob_size)
+        if HEADER_SIZE + sum(size + _pad(size) for size in sizes) != len(self.mm):
+            raise ValueError("Размер снапшота не совпадает с заголовком")
+
+        view = memoryview(self.mm)
+        pos = HEADER_SIZE
+
+        def take(size):
+            nonlocal pos
+            section = view[pos:pos + size]
+            pos += size + _pad(size)
+            return section
+
+        self.ids = take(8 * count).cast('Q')
+        self.rec_off = take(4 * (count + 1)).cast('I')
+        name_off = take(4 * (name_count + 1)).cast('I')
+        self.name_rec = take(4 * name_count).cast('I')
+        self.names = _Names(name_off, take(pool_size))
+        self.blob = take(blob_size)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def verify(self):
+        """Проверяет CRC32 тела (читает весь файл - вызывать в фоне)"""
+        crc = 0
+        view = memoryview(self.mm)
+        for start in range(HEADER_SIZE, len(view), 1 << 20):
+            crc = zlib.crc32(view[start:start + (1 << 20)], crc)
+        if crc != self.body_crc:
+            raise ValueError("Контрольная сумма снапшота не совпадает")
+
+    def record(self, index):
+        raw = bytes(self.blob[self.rec_off[index]:self.rec_off[index + 1]]).decode('utf-8')
+        user_id, username, level, reason, proof, date, reports_count, score, aliases = raw.split(RECORD_SEP)
+        return (user_id, username, int(level or 3), reason, proof, date,
+                int(reports_count or 0), int(score or 0)), aliases
+
+    def index_by_id(self, user_id):
+        user_id = int(user_id)
+        i = bisect.bisect_left(self.ids, user_id)
+        if i < len(self.ids) and self.ids[i] == user_id:
+            return i
+        return None
+
+    def index_by_name(self, username):
+        name = normalize_username(username).encode('utf-8')
+        i = bisect.bisect_left(self.names, name)
+        if i < len(self.names) and self.names[i] == name:
+            return self.name_rec[i]
+        return None
+
+
+class SnapshotReader:
+    """Читатель, который подхватывает новую версию файла после публикации.
+
+    Если файла нет или он испорчен, current() возвращает None - вызывающий
+    идёт в базу, пока снапшот не будет пересобран.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.snapshot = None
+        self.file_key = None
+        self.checked_at = time.monotonic()
+        self._reload()
+
+    def _reload(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        file_key = (stat.st_ino, stat.st_mtime_ns)
+        if file_key == self.file_key:
+            return
+        self.file_key = file_key
+        try:
+            # Подмена одной ссылкой: текущие запросы дочитывают старый файл
+            self.snapshot = Snapshot(self.path)
+            logger.info(f"📸 Открыт снапшот v{self.snapshot.version}: {len(self.snapshot)} записей")
+        except (OSError, ValueError) as e:
+            self.snapshot = None
+            logger.error(f"❌ Снапшот не читается: {e}")
+
+    def current(self):
+        now = time.monotonic()
+        if now - self.checked_at >= RELOAD_CHECK_INTERVAL:
+            self.checked_at = now
+            self._reload()
+        return self.snapshot
+
+    def discard(self, snapshot):
+        """Перестаёт отдавать испорченный снапшот"""
+        if self.snapshot is snapshot:
+            self.snapshot = None
+
+
+def find_user(snapshot, query):
+    """То же, что Database.find_user, но по снапшоту (без поиска по подстроке)"""
+    query = query.strip().replace('@', '')
+    if query.isdigit():
+        index = snapshot.index_by_id(query)
+        if index is not None:
+            return snapshot.record(index)[0], 'id'
+    index = snapshot.index_by_name(query)
+    if index is not None:
+        user_data = snapshot.record(index)[0]
+        if normalize_username(user_data[1]) == normalize_username(query):
+            return user_data, 'username'
+        return user_data, 'alias'
+    return None, None
+
+
+def get_aliases(snapshot, user_id):
+    index = snapshot.index_by_id(user_id) if str(user_id).isdigit() else None
+    if index is None:
+        return []
+    aliases = snapshot.record(index)[1]
+    return aliases.split(',') if aliases else []
+
+
+def verify_or_rebuild(database, path, reader):
+    """Проверяет снапшот целиком и пересобирает его, если он негоден. Возвращает версию"""
+    snapshot = reader.current()
+    if snapshot is not None:
+        try:
+            snapshot.verify()
+            return snapshot.version
+        except ValueError as e:
+            logger.error(f"❌ {e}, пересобираю")
+            reader.discard(snapshot)
+    return write_snapshot(database, path)
+
+
+async def publish_snapshots(database, path, interval, reader=None, ready=None):
+    """Единственный, кто пишет снапшот.
+
+    Первым проходом проверяет файл (негодный или отсутствующий
+    пересобирается) и выставляет ready, дальше перевыпускает снапшот, как
+    только в журнале появились изменения. Проходы идут по очереди, поэтому
+    одна и та же версия не собирается параллельно"""
+    reader = reader or SnapshotReader(path)
+    published_version = None
+    while True:
+        try:
+            if published_version is None:
+                published_version = await asyncio.to_thread(verify_or_rebuild, database, path, reader)
+            elif database.get_last_change_seq() != published_version:
+                published_version = await asyncio.to_thread(write_snapshot, database, path)
+        except Exception as e:
+            published_version = None
+            logger.error(f"❌ Ошибка публикации снапшота: {e}")
+        if ready is not None:
+            # И после ошибки: без снапшота читатели идут в базу
+            ready.set()
+        await asyncio.sleep(interval)
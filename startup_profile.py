@@ -0,0 +1,95 @@
+"""
+Замер холодного старта: python main.py --profile-startup
+
+Импорты меряются в отдельном процессе через `python -X importtime`
+(в текущем процессе всё уже импортировано), время собственного импорта
+суммируется по верхнеуровневым модулям. Инициализация меряется здесь же
+по этапам в том порядке, в каком их проходит main().
+"""
+
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Сколько самых дорогих модулей показывать
+TOP_MODULES = 15
+
+
+def measure_imports(module="main"):
+    """Возвращает ({модуль: мкс собственного импорта}, общее время в мкс)"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BASE_DIR, capture_output=True, text=True,
+    )
+    times = defaultdict(int)
+    total = 0
+    for line in result.stderr.splitlines():
+        # import time:       self [us] |  cumulative | imported package
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        times[name.strip().split(".")[0]] += int(self_us)
+        total += int(self_us)
+    if result.returncode != 0:
+        print(result.stderr.strip().splitlines()[-1])
+    return times, total
+
+
+def _timed(stages, name, func):
+    started = time.perf_counter()
+    try:
+        result = func()
+    except Exception as e:
+        stages.append((name, time.perf_counter() - started, f"ошибка: {e}"))
+        return None
+    stages.append((name, time.perf_counter() - started, ""))
+    return result
+
+
+def measure_init():
+    """Этапы инициализации в текущем процессе: [(этап, секунды, примечание)]"""
+    import main
+    from config import SNAPSHOT_PATH
+    from database import db
+    from fuzzy import fuzzy_index
+    from prefix_index import prefix_index
+    from snapshot import SnapshotReader
+
+    stages = []
+    bot = _timed(stages, "Bot()", main.create_bot)
+    dp = _timed(stages, "Dispatcher + FSM storage", main.create_dispatcher)
+    _timed(stages, "Database() (DDL)", db.instance)
+    _timed(stages, "открытие снапшота", lambda: SnapshotReader(SNAPSHOT_PATH))
+
+    async def get_me():
+        try:
+            return await bot.me()
+        finally:
+            await bot.session.close()
+
+    if bot is not None:
+        _timed(stages, "getMe", lambda: asyncio.run(get_me()))
+    if dp is not None:
+        _timed(stages, "закрытие FSM storage", lambda: asyncio.run(dp.fsm.storage.close()))
+    # Не на пути старта, но платит первый запрос, который до них дойдёт
+    _timed(stages, "префиксный индекс (1-й inline)", prefix_index.load)
+    _timed(stages, "нечёткий индекс (1-й промах)", fuzzy_index.load)
+    return stages
+
+
+def profile_startup():
+    print("⏱ Импорт (собственное время, по модулям):")
+    times, total = measure_imports()
+    local = {name[:-3] for name in os.listdir(BASE_DIR) if name.endswith(".py")}
+    for name, us in sorted(times.items(), key=lambda item: -item[1])[:TOP_MODULES]:
+        mark = "*" if name in local else " "
+        print(f"  {mark} {name:<28} {us / 1000:8.1f} мс")
+    print(f"    {'всего':<28} {total / 1000:8.1f} мс   (* - модули проекта)")
+
+    print("⏱ Инициализация:")
+    for name, seconds, note in measure_init():
+        print(f"    {name:<32} {seconds * 1000:8.1f} мс  {note}")
@@ -2,57 +2,166 @@
 """
 Супервизор для бота Telegram
 Автоматически перезапускает бота при падении
+
+Супервизор не опрашивает процесс, а ждёт его завершения: упавший бот
+перезапускается сразу, задержка (1, 2, 4 ... 60 с) появляется только
+если бот падает несколько раз подряд, не проработав STABLE_AFTER секунд.
+
+Сигналы:
+  SIGTERM / Ctrl+C - передаётся боту, он дорабатывает текущие апдейты
+  SIGHUP           - перезапуск (деплой)
+
+При перезапуске старый процесс останавливается до запуска нового: два
+процесса с long polling одновременно получают от Telegram 409 Conflict
+на getUpdates.
 """
 
+import argparse
 import asyncio
-import subprocess
-import time
-import sys
+import logging
 import os
+import signal
+import sys
+import time
 from datetime import datetime
 
-
-def setup_logging():
-    """Настраивает логирование"""
-    log_dir = "logs"
-    if not os.path.exists(log_dir):
-        os.makedirs(log_dir)
-
-    log_file = os.path.join(log_dir, f"bot_{datetime.now().strftime('%Y%m%d')}.log")
-    return log_file
-
-
-def run_bot():
-    """Запускает основного бота"""
-    log_file = setup_logging()
-
-    print(f"[{datetime.now().strftime('%H:%M:%S')}] 🚀 Запуск Telegram бота...")
-    print(f"[{datetime.now().strftime('%H:%M:%S')}] 📝 Логи пишутся в: {log_file}")
-
-    try:
-        # Запускаем бота с перенаправлением вывода в лог
-        with open(log_file, "a", encoding="utf-8") as log:
-            log.write(f"\n{'=' * 60}\n")
-            log.write(f"🚀 Запуск бота: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            log.write(f"{'=' * 60}\n")
-
-            process = subprocess.Popen(
-                [sys.executable, "main.py"],
-                stdout=log,
-                stderr=log,
-                universal_newlines=True,
-                bufsize=1
-            )
-
-            return process
-
-    except Exception as e:
-        print(f"[{datetime.now().strftime('%H:%M:%S')}] 💥 Ошибка при запуске бота: {e}")
-        return None
+from config import LOG_DIR, SHUTDOWN_TIMEOUT
+from logging_setup import setup_logging
+
+logger = logging.getLogger("supervisor")
+# stdout/stderr бота: его собственные логи идут в logs/bot.log, сюда - только
+# то, что мимо logging (трейсбеки при падении до настройки логов, print)
+child_logger = logging.getLogger("supervisor.child")
+
+# Сколько должен проработать бот, чтобы падение не считалось частью серии
+STABLE_AFTER = 30
+BACKOFF_BASE = 1
+BACKOFF_MAX = 60
+# Сколько ждать мягкой остановки после SIGTERM, потом kill: срок самого бота
+# плюс запас на подтверждение offset и выход процесса
+STOP_MARGIN = 10
+STOP_TIMEOUT = SHUTDOWN_TIMEOUT + STOP_MARGIN
+
+
+class Supervisor:
+    def __init__(self, command):
+        self.command = command
+        self.stopping = False
+        self.restart_requested = asyncio.Event()
+        self.restart_count = 0
+        self.crash_streak = 0
+        self.pumps = set()
+
+    def say(self, text):
+        line = f"[{datetime.now().strftime('%H:%M:%S')}] {text}"
+        print(line, flush=True)
+        logger.info(text)
+
+    async def pump(self, stream, pid):
+        """Переносит вывод бота в лог супервизора построчно"""
+        while line := await stream.readline():
+            text = line.decode('utf-8', errors='replace').rstrip()
+            child_logger.warning(text, extra={'fields': {'pid': pid}})
+
+    async def spawn(self):
+        """Запускает бота, его вывод уходит в лог супервизора"""
+        env = dict(os.environ, BOT_LOG_CONSOLE="0")
+        process = await asyncio.create_subprocess_exec(
+            *self.command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT, env=env)
+        pump = asyncio.create_task(self.pump(process.stdout, process.pid))
+        self.pumps.add(pump)
+        pump.add_done_callback(self.pumps.discard)
+        self.say(f"🚀 Бот запущен, PID {process.pid}")
+        return process
+
+    async def stop(self, process):
+        """SIGTERM, ожидание мягкой остановки, затем kill"""
+        if process.returncode is not None:
+            return process.returncode
+        process.terminate()
+        try:
+            return await asyncio.wait_for(process.wait(), STOP_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.say(f"⚠️ Бот не остановился за {STOP_TIMEOUT} с, kill")
+            process.kill()
+            return await process.wait()
+
+    def on_stop_signal(self):
+        self.say("🛑 Получен сигнал остановки...")
+        self.stopping = True
+        self.restart_requested.set()
+
+    def on_restart_signal(self):
+        self.say("🔁 Запрошен перезапуск")
+        self.restart_requested.set()
+
+    def backoff(self, uptime):
+        """Задержка перед перезапуском: 0, пока бот не падает серией"""
+        if uptime >= STABLE_AFTER:
+            self.crash_streak = 0
+        self.crash_streak += 1
+        if self.crash_streak <= 1:
+            return 0
+        return min(BACKOFF_BASE * 2 ** (self.crash_streak - 2), BACKOFF_MAX)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        for sig, callback in ((signal.SIGTERM, self.on_stop_signal), (signal.SIGINT, self.on_stop_signal),
+                              (getattr(signal, 'SIGHUP', None), self.on_restart_signal)):
+            if sig is None:
+                continue
+            try:
+                loop.add_signal_handler(sig, callback)
+            except NotImplementedError:
+                # Windows: остаётся Ctrl+C через KeyboardInterrupt
+                pass
+
+        process = await self.spawn()
+        started = time.monotonic()
+        while True:
+            exited = asyncio.ensure_future(process.wait())
+            restart = asyncio.ensure_future(self.restart_requested.wait())
+            await asyncio.wait({exited, restart}, return_when=asyncio.FIRST_COMPLETED)
+            restart.cancel()
+
+            if self.stopping:
+                exited.cancel()
+                return_code = await self.stop(process)
+                self.say(f"👋 Бот остановлен с кодом {return_code}")
+                return
+
+            if exited.done():
+                self.say(f"⚠️ Бот завершился с кодом: {process.returncode}")
+                delay = self.backoff(time.monotonic() - started)
+                if delay:
+                    self.say(f"⏳ Падения подряд: {self.crash_streak}, перезапуск через {delay} с...")
+                    try:
+                        await asyncio.wait_for(self.restart_requested.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+                    if self.stopping:
+                        return
+            else:
+                exited.cancel()
+                await self.stop(process)
+
+            self.restart_requested.clear()
+            self.restart_count += 1
+            try:
+                process = await self.spawn()
+            except Exception as e:
+                self.say(f"💥 Ошибка при запуске бота: {e}")
+                await asyncio.sleep(BACKOFF_MAX)
+                continue
+            started = time.monotonic()
 
 
 def main():
     """Основная функция супервизора"""
+    parser = argparse.ArgumentParser(description="Супервизор бота TRUSTON")
+    parser.add_argument("bot_args", nargs="*", help="аргументы для main.py")
+    args = parser.parse_args()
+
     print(f"{'=' * 60}")
     print("🤖 СУПЕРВИЗОР TRUSTON БОТА")
     print(f"{'=' * 60}")
@@ -62,86 +171,20 @@ def main():
     print(f"📁 Рабочая директория: {os.getcwd()}")
     print(f"{'=' * 60}")
 
-    restart_count = 0
-    max_restarts = 50  # Максимальное количество перезапусков
-    restart_delay = 10  # Задержка между перезапусками (секунды)
-
-    while restart_count < max_restarts:
-        try:
-            print(f"\n[{datetime.now().strftime('%H:%M:%S')}] 🔄 Попытка #{restart_count + 1}")
-
-            # Запускаем бота
-            bot_process = run_bot()
-
-            if bot_process is None:
-                print(f"[{datetime.now().strftime('%H:%M:%S')}] ⚠️ Не удалось запустить бота")
-                restart_count += 1
-                time.sleep(restart_delay)
-                continue
-
-            # Ждем завершения процесса бота
-            while True:
-                try:
-                    # Проверяем статус процесса
-                    return_code = bot_process.poll()
-
-                    if return_code is not None:
-                        # Процесс завершился
-                        print(f"[{datetime.now().strftime('%H:%M:%S')}] ⚠️ Бот завершился с кодом: {return_code}")
-
-                        # Записываем в лог
-                        with open(setup_logging(), "a", encoding="utf-8") as log:
-                            log.write(f"\n{'=' * 60}\n")
-                            log.write(f"⚠️ Бот завершился: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-                            log.write(f"📊 Код завершения: {return_code}\n")
-                            log.write(f"🔄 Перезапуск через {restart_delay} секунд...\n")
-                            log.write(f"{'=' * 60}\n")
-
-                        break
-
-                    # Ждем немного перед следующей проверкой
-                    time.sleep(5)
+    # Ротируемые файлы: logs/supervisor.log и logs/bot.log (пишет сам бот)
+    setup_logging("supervisor", console=False)
+    print(f"📝 Логи пишутся в: {LOG_DIR}/")
+    logger.info("🚀 Запуск супервизора")
 
-                except KeyboardInterrupt:
-                    print(f"\n[{datetime.now().strftime('%H:%M:%S')}] 🛑 Получен сигнал остановки...")
-                    bot_process.terminate()
-                    try:
-                        bot_process.wait(timeout=10)
-                    except subprocess.TimeoutExpired:
-                        bot_process.kill()
-                    print(f"[{datetime.now().strftime('%H:%M:%S')}] 👋 Супервизор остановлен")
-                    return
-
-                except Exception as e:
-                    print(f"[{datetime.now().strftime('%H:%M:%S')}] ⚠️ Ошибка мониторинга: {e}")
-                    break
-
-            restart_count += 1
-
-            if restart_count >= max_restarts:
-                print(f"[{datetime.now().strftime('%H:%M:%S')}] ⛔ Достигнут лимит перезапусков ({max_restarts})")
-                break
-
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] ⏳ Перезапуск через {restart_delay} секунд...")
-
-            # Постепенно увеличиваем задержку при частых падениях
-            if restart_count > 5:
-                restart_delay = min(restart_delay * 1.5, 300)  # Максимум 5 минут
-
-            time.sleep(restart_delay)
-
-        except KeyboardInterrupt:
-            print(f"\n[{datetime.now().strftime('%H:%M:%S')}] 🛑 Супервизор остановлен пользователем")
-            break
-
-        except Exception as e:
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] 💥 Критическая ошибка супервизора: {e}")
-            restart_count += 1
-            time.sleep(restart_delay)
+    supervisor = Supervisor([sys.executable, "main.py", *args.bot_args])
+    try:
+        asyncio.run(supervisor.run())
+    except KeyboardInterrupt:
+        print(f"\n[{datetime.now().strftime('%H:%M:%S')}] 🛑 Супервизор остановлен пользователем")
 
     print(f"\n[{datetime.now().strftime('%H:%M:%S')}] ⛔ Супервизор завершает работу")
-    print(f"[{datetime.now().strftime('%H:%M:%S')}] 📊 Всего перезапусков: {restart_count}")
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] 📊 Всего перезапусков: {supervisor.restart_count}")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,51 +1,59 @@
-import sqlite3
-import os
-
-
-def update_database():
-    db_path = 'scam_database.db'
-
-    if not os.path.exists(db_path):
-        print("❌ База данных не найдена!")
-        return
-
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+"""
+Обновление схемы базы без запуска бота: python update_db.py [--status]
 
-    print("🔄 Обновляю структуру базы данных...")
+Применяет миграции из migrations.py к базе бота и доводит дозаполнения до
+конца (бот делает то же самое сам при старте, дозаполнения - в фоне).
+Работает без вопросов, можно запускать из скриптов деплоя; если бот
+запущен, пачки дозаполнения просто чередуются с его записями.
+"""
 
-    # Проверяем существующие колонки
-    cursor.execute("PRAGMA table_info(scammers)")
-    columns = [col[1] for col in cursor.fetchall()]
-
-    print(f"Текущие колонки: {columns}")
-
-    # Добавляем колонку files если её нет
-    if 'files' not in columns:
-        print("➕ Добавляю колонку 'files'...")
-        cursor.execute("ALTER TABLE scammers ADD COLUMN files TEXT DEFAULT '[]'")
-
-    # Добавляем таблицу files если её нет
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='files'")
-    if not cursor.fetchone():
-        print("➕ Создаю таблицу 'files'...")
-        cursor.execute('''
-                       CREATE TABLE files
-                       (
-                           id              INTEGER PRIMARY KEY AUTOINCREMENT,
-                           file_id         TEXT UNIQUE NOT NULL,
-                           file_type       TEXT,
-                           caption         TEXT,
-                           related_user_id TEXT,
-                           uploaded_date   TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                       )
-                       ''')
-
-    conn.commit()
-    conn.close()
+import argparse
+import logging
+import os
+import sqlite3
+import sys
+
+import migrations
+from config import DB_PATH
+
+
+def show_status(conn):
+    version = migrations.current_version(conn)
+    print(f"Версия схемы: {version} из {migrations.LATEST_VERSION}")
+    for name, last_rowid, until_rowid in migrations.pending_backfills(conn):
+        print(f"• дозаполнение {name}: {last_rowid}/{until_rowid}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Миграции базы TRUSTON")
+    parser.add_argument("--db", default=DB_PATH, help="файл базы")
+    parser.add_argument("--status", action="store_true", help="только показать версию схемы")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if not os.path.exists(args.db):
+        print(f"❌ База данных {args.db} не найдена!")
+        return 1
+
+    conn = sqlite3.connect(args.db)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA busy_timeout=5000')
+    try:
+        if args.status:
+            try:
+                show_status(conn)
+            except sqlite3.OperationalError:
+                print("Версия схемы: 0 (база создана до миграций)")
+            return 0
+        print("🔄 Обновляю структуру базы данных...")
+        migrations.migrate(conn)
+        migrations.run_backfills(args.db)
+        show_status(conn)
+    finally:
+        conn.close()
     print("✅ База данных успешно обновлена!")
+    return 0
 
 
 if __name__ == "__main__":
-    update_database()
-    input("Нажмите Enter для выхода...")
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,69 @@
+"""
+Контекст апдейта для структурных логов
+
+Внешний middleware выставляет log_context (update_id, user_id, chat_id) на
+время обработки, внутренний дописывает имя сработавшего обработчика,
+а по завершении в лог уходит одна запись с длительностью.
+"""
+
+import logging
+import time
+
+from aiogram import BaseMiddleware
+
+from logging_setup import log_context
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateContextMiddleware(BaseMiddleware):
+    """Внешний middleware dp.update"""
+
+    async def __call__(self, handler, event, data):
+        user = data.get('event_from_user')
+        chat = data.get('event_chat')
+        context = {
+            'update_id': event.update_id,
+            'event': event.event_type,
+            'user_id': user.id if user is not None else None,
+            'chat_id': chat.id if chat is not None else None,
+            'handler': None,
+        }
+        token = log_context.set(context)
+        started = time.perf_counter()
+        status = 'ok'
+        try:
+            return await handler(event, data)
+        except Exception:
+            status = 'error'
+            raise
+        finally:
+            duration_ms = (time.perf_counter() - started) * 1000
+            metrics.inc('updates')
+            metrics.observe('update', duration_ms)
+            logger.info("update", extra={'fields': {
+                'duration_ms': round(duration_ms, 2),
+                'status': status,
+            }})
+            log_context.reset(token)
+
+
+class HandlerNameMiddleware(BaseMiddleware):
+    """Внутренний middleware: имя обработчика, до которого дошёл апдейт"""
+
+    async def __call__(self, handler, event, data):
+        context = log_context.get()
+        handler_object = data.get('handler')
+        if context is not None and handler_object is not None:
+            context['handler'] = handler_object.callback.__name__
+        return await handler(event, data)
+
+
+def install(dp):
+    dp.update.outer_middleware(UpdateContextMiddleware())
+    # Внутренние middleware родителя действуют и во вложенных роутерах
+    handler_name = HandlerNameMiddleware()
+    for name, observer in dp.observers.items():
+        if name not in ('update', 'error'):
+            observer.middleware(handler_name)